@@ -0,0 +1,320 @@
+import collections
+import random
+
+import numpy as np
+import networkx as nx
+
+import compact_graph
+from compact_graph import CompactRankedGraph
+
+"""
+The edges that occur in some rank maximal matching, and the other rank
+maximal matchings, from a single run of the algorithm.
+    Pruning every phase (the last one too) leaves the reduced graph H. A
+    matching is rank maximal exactly if it is a matching of H that covers the
+    critical nodes, the nodes that were odd or unreachable in some phase (for
+    every rank r, its edges of rank at most r are then a maximum matching of
+    G'r, see `verify_rank_maximal_matching`). All of them have the same size k,
+    so adding a dummy right node for every left node a matching of size k
+    leaves free (joined to the non critical left nodes) and a dummy left node
+    for every free right node makes them the perfect matchings of H plus the
+    dummies. By Dulmage and Mendelsohn an edge is in some perfect matching iff
+    it is matched or its ends are in the same strongly connected component of
+    the digraph D that orients the matched edges right to left and the other
+    edges left to right. The dummy nodes of a side are interchangeable, so
+    each side's dummies are one node of D: Z_R (node n) with the edges x -> Z_R
+    from the non critical left nodes and Z_R -> f to the free left nodes, and
+    Z_L (node n + 1) with Z_L -> p to the non critical right nodes and p -> Z_L
+    from the free right nodes.
+    Exchanging the matching along a cycle of D gives another rank maximal
+    matching, which is how the other matchings are enumerated and sampled.
+"""
+
+
+def reduced_graph(G, rank="rank", top_nodes=None):
+    """Returns the reduced graph of the rank maximal matchings of `G`.
+
+    Parameters
+    ----------
+    G, rank, top_nodes : as in `rank_maximal_matching`
+
+    Returns
+    -------
+    H : NetworkX graph
+      The nodes of `G` and the edges left by the pruning of every phase, with
+      their ranks. The node attribute "critical" is True for the nodes that
+      every rank maximal matching matches. The rank maximal matchings of `G`
+      are the matchings of `H` that match all the critical nodes.
+    """
+    H = nx.Graph()
+    H.add_nodes_from(G, critical=False)
+    if G.number_of_edges() == 0:
+        return H
+    cg = CompactRankedGraph.from_graph(G, rank, top_nodes)
+    mate, alive, critical = _reduce(cg)
+    nodes = cg.nodes
+    for u in np.flatnonzero(critical).tolist():
+        H.nodes[nodes[u]]["critical"] = True
+    H.add_edges_from((nodes[u], nodes[v], {rank: rank_e}) for u, v, rank_e in
+                     zip(cg.tails[alive].tolist(), cg.heads[alive].tolist(), cg.ranks[alive].tolist()))
+    return H
+
+
+def allowed_edges(G, rank="rank", top_nodes=None):
+    """Returns the edges of `G` that occur in at least one rank maximal matching.
+
+    One run of the algorithm and one strongly connected components pass,
+    O(n + m) on top of `rank_maximal_matching`, instead of a run per edge.
+
+    Parameters
+    ----------
+    G, rank, top_nodes : as in `rank_maximal_matching`
+
+    Returns
+    -------
+    edges : set
+      Pairs ``(u, v)`` with `u` a top node
+
+    Examples
+    --------
+        >>> G = nx.Graph()
+        >>> G.add_weighted_edges_from([('a1', 'p1', 1), ('a2', 'p1', 1), ('a2', 'p2', 2), ('a3', 'p2', 2)], weight="rank")
+        >>> sorted(allowed_edges(G, top_nodes=['a1', 'a2', 'a3']))
+        [('a1', 'p1'), ('a2', 'p1'), ('a2', 'p2'), ('a3', 'p2')]
+    """
+    if G.number_of_edges() == 0:
+        return set()
+    cg = CompactRankedGraph.from_graph(G, rank, top_nodes)
+    mate, alive, critical = _reduce(cg)
+    allowed = _allowed(cg, mate, alive, critical)
+    nodes = cg.nodes
+    return {(nodes[u], nodes[v]) for u, v in zip(cg.tails[allowed].tolist(), cg.heads[allowed].tolist())}
+
+
+def enumerate_rank_maximal_matchings(G, rank="rank", top_nodes=None):
+    """Returns a generator of all the rank maximal matchings of `G`, each once.
+
+    The matchings are split in two, those without an allowed edge e, with the
+    current matching, and those with it, with the matching one exchange along
+    a cycle of D through e away, and both halves in turn, as in the
+    enumeration of perfect matchings of Uno. Every split yields a new
+    matching, so the delay between two matchings is O(n + m).
+
+    Parameters
+    ----------
+    G, rank, top_nodes : as in `rank_maximal_matching`
+
+    Yields
+    ------
+    M : dictionary
+      A rank maximal matching, as returned by `rank_maximal_matching`
+    """
+    if G.number_of_edges() == 0:
+        yield {}
+        return
+    cg = CompactRankedGraph.from_graph(G, rank, top_nodes)
+    mate, alive, critical = _reduce(cg)
+    yield cg.matching_dict(mate)
+    stack = [(mate, _allowed(cg, mate, alive, critical), critical)]
+    while stack:
+        mate, usable, critical = stack.pop()
+        component = _strong_components(cg, mate, usable, critical)
+        choices = np.flatnonzero(usable & ~cg.matched_edges(mate) &
+                                 (component[cg.tails] == component[cg.heads]))
+        if not len(choices):
+            continue
+        e = int(choices[0])
+        u, v = int(cg.tails[e]), int(cg.heads[e])
+        other = mate.copy()
+        _exchange(cg, other, _cycle(cg, mate, usable, critical, e))
+        yield cg.matching_dict(other)
+        without = usable.copy()
+        without[e] = False
+        with_e = usable.copy()
+        with_e[cg.adjacent_edges[cg.indptr[u]:cg.indptr[u + 1]]] = False
+        with_e[cg.adjacent_edges[cg.indptr[v]:cg.indptr[v + 1]]] = False
+        with_e[e] = True
+        forced = critical.copy()
+        forced[[u, v]] = True
+        stack.append((mate, without, critical))
+        stack.append((other, with_e, forced))
+
+
+def random_rank_maximal_matching(G, rank="rank", top_nodes=None, steps=1000, seed=None):
+    """Returns a random rank maximal matching of `G`.
+
+    Starts from the matching of `rank_maximal_matching` and takes `steps`
+    random exchanges, each along a cycle of D through an allowed edge chosen
+    uniformly. The distribution approaches uniform as `steps` grows but is
+    not exactly uniform.
+
+    Parameters
+    ----------
+    G, rank, top_nodes : as in `rank_maximal_matching`
+    steps : int, optional (default=1000)
+      Number of exchanges, each costs a breadth first search of D
+    seed : int or random.Random, optional
+
+    Returns
+    -------
+    M : dictionary
+      A rank maximal matching, as returned by `rank_maximal_matching`
+    """
+    if G.number_of_edges() == 0:
+        return {}
+    rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+    cg = CompactRankedGraph.from_graph(G, rank, top_nodes)
+    mate, alive, critical = _reduce(cg)
+    allowed = _allowed(cg, mate, alive, critical)
+    choices = np.flatnonzero(allowed).tolist()
+    for _ in range(steps):
+        e = rng.choice(choices)
+        if mate[cg.tails[e]] != cg.heads[e]:
+            _exchange(cg, mate, _cycle(cg, mate, allowed, critical, e))
+    return cg.matching_dict(mate)
+
+
+def _reduce(cg):
+    """
+    runs the algorithm and prunes in every phase, the last one too
+    return - (mate array of a rank maximal matching, alive mask of the edges
+             of the reduced graph, bool array of the critical nodes)
+    """
+    mate = compact_graph.solve(cg)
+    match_phase = compact_graph.matched_phases(cg, mate)
+    alive = np.ones(cg.m, dtype=bool)
+    critical = np.zeros(cg.n, dtype=bool)
+    for k, rank_i in enumerate(cg.rank_values.tolist()):
+        # the matched edges of rank at most rank_i are a maximum matching of G'i
+        label = compact_graph.decompose(cg, np.where(match_phase <= k, mate, -1), alive, rank_i)
+        compact_graph.prune(cg, alive, label, rank_i)
+        critical |= label != compact_graph.EVEN
+    return mate, alive, critical
+
+
+def _allowed(cg, mate, usable, critical):
+    """return - bool array of the usable edges in some matching of the usable edges that covers the critical nodes"""
+    component = _strong_components(cg, mate, usable, critical)
+    return usable & (cg.matched_edges(mate) | (component[cg.tails] == component[cg.heads]))
+
+
+def _successors(cg, mate, usable, critical):
+    """
+    return - list of the out-neighbors in D of every node, Z_R = n and Z_L = n + 1
+    """
+    n = cg.n
+    successors = [[] for _ in range(n + 2)]
+    free = mate < 0
+    unmatched = usable & ~cg.matched_edges(mate)
+    for u, v in zip(cg.tails[unmatched].tolist(), cg.heads[unmatched].tolist()):
+        successors[u].append(v)
+    for v, u in enumerate(mate.tolist()):
+        if u >= 0 and not cg.is_left[v]:
+            successors[v].append(u)
+    for x in np.flatnonzero(cg.is_left & ~critical).tolist():
+        successors[x].append(n)
+    successors[n] = np.flatnonzero(cg.is_left & free).tolist()
+    successors[n + 1] = np.flatnonzero(~cg.is_left & ~critical).tolist()
+    for p in np.flatnonzero(~cg.is_left & free).tolist():
+        successors[p].append(n + 1)
+    return successors
+
+
+def _strong_components(cg, mate, usable, critical):
+    """
+    iterative Tarjan on D
+    return - int array with the number of the strongly connected component of every node of cg
+    """
+    successors = _successors(cg, mate, usable, critical)
+    size = len(successors)
+    index, low, component = [-1] * size, [0] * size, [-1] * size
+    on_stack = [False] * size
+    stack = []
+    counter = components = 0
+    for root in range(size):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        # frames [node, position in its successors]
+        work = [[root, 0]]
+        while work:
+            frame = work[-1]
+            v = frame[0]
+            if frame[1] < len(successors[v]):
+                w = successors[v][frame[1]]
+                frame[1] += 1
+                if index[w] < 0:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append([w, 0])
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+            work.pop()
+            if work and low[v] < low[work[-1][0]]:
+                low[work[-1][0]] = low[v]
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component[w] = components
+                    if w == v:
+                        break
+                components += 1
+    return np.array(component[:cg.n])
+
+
+def _cycle(cg, mate, usable, critical, e):
+    """
+    e - usable unmatched edge with both ends in the same strongly connected component of D
+    return - the nodes of a cycle of D through e, starting with the right end of e
+    The breadth first search generates the successors of the nodes it reaches
+    only, so a short cycle costs little in a large graph.
+    """
+    n = cg.n
+    indptr, adjacent, heads = cg.indptr.data, cg.adjacent_edges.data, cg.heads.data
+    is_left, mate_, usable_, critical_ = cg.is_left.data, mate.data, usable.data, critical.data
+    u, v = int(cg.tails[e]), int(cg.heads[e])
+    parent = {v: None}
+    queue = collections.deque([v])
+    while u not in parent:
+        x = queue.popleft()
+        if x == n:
+            successors = np.flatnonzero(cg.is_left & (mate < 0)).tolist()
+        elif x == n + 1:
+            successors = np.flatnonzero(~cg.is_left & ~critical).tolist()
+        elif is_left[x]:
+            successors = [heads[f] for f in adjacent[indptr[x]:indptr[x + 1]]
+                          if usable_[f] and heads[f] != mate_[x]]
+            if not critical_[x]:
+                successors.append(n)
+        else:
+            successors = [mate_[x] if mate_[x] >= 0 else n + 1]
+        for y in successors:
+            if y not in parent:
+                parent[y] = x
+                queue.append(y)
+    cycle = [u]
+    while cycle[-1] != v:
+        cycle.append(parent[cycle[-1]])
+    return cycle[::-1]
+
+
+def _exchange(cg, mate, cycle):
+    """
+    exchanges the matching along a cycle of D, its left to right steps between
+    nodes of cg become matched and the nodes left without one become free
+    """
+    n = cg.n
+    for x in cycle:
+        if x < n:
+            mate[x] = -1
+    for x, y in zip(cycle, cycle[1:] + cycle[:1]):
+        if x < n and y < n and cg.is_left[x]:
+            mate[x] = y
+            mate[y] = x
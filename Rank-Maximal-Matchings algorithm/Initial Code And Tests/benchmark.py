@@ -0,0 +1,196 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import networkx as nx
+
+import compact_graph
+import rank_maximal_matching as rmm
+from compact_graph import CompactRankedGraph
+
+"""
+Benchmarks of rank_maximal_matching on synthetic ranked bipartite graphs.
+    Every workload is a seeded random instance: applicants rank a bounded
+    list of posts, drawn with a Zipf skewed popularity, with or without ties.
+    For every workload and size the wall time, the peak memory (tracemalloc,
+    in a separate run so it does not slow the timed one) and the statistics of
+    every rank phase (compact_graph.solve's on_phase) are written as JSON, so
+    runs can be compared:
+        python benchmark.py --sizes 1000 10000 100000 --output before.json
+        python benchmark.py --sizes 1000 10000 100000 --output after.json --compare before.json
+    The steps of a phase are augment (hopcroft_karp_matching in the original
+    implementation), decompose (divide_to_sets) and prune (remove_edges);
+    create_Gi has no cost of its own on the compact graph (Gi is a prefix of
+    the adjacency lists), the phases report edges_added instead.
+"""
+
+WORKLOADS = {
+    # name: keyword arguments of ranked_bipartite_graph, apart from the size
+    "few_ranks_ties": dict(list_length=5, n_ranks=3, ties=True, zipf_exponent=1.0, posts_ratio=0.5),
+    "many_ranks_strict": dict(list_length=20, n_ranks=20, ties=False, zipf_exponent=1.0, posts_ratio=0.5),
+    "uniform_sparse": dict(list_length=3, n_ranks=3, ties=False, zipf_exponent=0.0, posts_ratio=1.0),
+    "skewed_dense": dict(list_length=50, n_ranks=10, ties=True, zipf_exponent=1.5, posts_ratio=0.05),
+    "few_posts": dict(list_length=5, n_ranks=5, ties=False, zipf_exponent=0.5, posts_ratio=0.002),
+}
+
+
+def ranked_bipartite_graph(n_applicants, n_posts, list_length, n_ranks, ties=True, zipf_exponent=1.0, seed=None):
+    """Returns a random ranked bipartite graph of applicants and posts.
+
+    Parameters
+    ----------
+    n_applicants, n_posts : int
+      Number of applicants (``('a', i)``, ``bipartite=0``) and posts
+      (``('p', j)``, ``bipartite=1``)
+    list_length : int
+      Maximum length of the preference list of an applicant
+    n_ranks : int
+      Number of distinct ranks. Without ties every position of a list has its
+      own rank, and lists are cut to `n_ranks` posts.
+    ties : bool
+      If True, consecutive positions of a list share a rank: position k gets
+      rank ``1 + k * n_ranks // list_length``.
+    zipf_exponent : float
+      Post j is drawn with probability proportional to ``(j + 1) ** -zipf_exponent``,
+      0 is uniform popularity
+    seed : int, optional
+
+    Returns
+    -------
+    G : NetworkX graph with the ranks in the edge attribute "rank"
+    """
+    rng = np.random.default_rng(seed)
+    if not ties:
+        list_length = min(list_length, n_ranks)
+    list_length = min(list_length, n_posts)
+    popularity = np.arange(1, n_posts + 1, dtype=float) ** -zipf_exponent
+    cumulative = np.cumsum(popularity / popularity.sum())
+    G = nx.Graph()
+    G.add_nodes_from((("a", i) for i in range(n_applicants)), bipartite=0)
+    G.add_nodes_from((("p", j) for j in range(n_posts)), bipartite=1)
+    lengths = rng.integers(1, list_length + 1, size=n_applicants)
+    for i, length in enumerate(lengths.tolist()):
+        posts = []
+        seen = set()
+        while len(posts) < length:
+            draws = np.searchsorted(cumulative, rng.random(2 * length), side="right")
+            for j in np.minimum(draws, n_posts - 1).tolist():
+                if j not in seen and len(posts) < length:
+                    seen.add(j)
+                    posts.append(j)
+        for k, j in enumerate(posts):
+            rank = 1 + k * n_ranks // list_length if ties else k + 1
+            G.add_edge(("a", i), ("p", j), rank=rank)
+    return G
+
+
+def workload_graph(name, n_edges, seed=0):
+    """Returns the graph of the workload `name` with about `n_edges` edges."""
+    parameters = dict(WORKLOADS[name])
+    posts_ratio = parameters.pop("posts_ratio")
+    mean_length = (min(parameters["list_length"], parameters["n_ranks"]) if not parameters["ties"]
+                   else parameters["list_length"]) / 2 + 0.5
+    n_applicants = max(1, int(n_edges / mean_length))
+    # at least a full preference list of posts, or small sizes could not reach n_edges
+    n_posts = max(parameters["list_length"], int(n_applicants * posts_ratio))
+    return ranked_bipartite_graph(n_applicants, n_posts, seed=seed, **parameters)
+
+
+def run_case(name, n_edges, seed=0):
+    """Returns the measurements of one workload and size as a dictionary."""
+    G = workload_graph(name, n_edges, seed)
+    top_nodes = [node for node in G if node[0] == "a"]
+    result = {"workload": name, "size": n_edges, "seed": seed,
+              "nodes": G.number_of_nodes(), "edges": G.number_of_edges()}
+    start = time.perf_counter()
+    M = rmm.rank_maximal_matching(G, top_nodes=top_nodes)
+    result["wall_time"] = time.perf_counter() - start
+    result["matching_size"] = len(M) // 2
+    del M
+    tracemalloc.start()
+    rmm.rank_maximal_matching(G, top_nodes=top_nodes)
+    result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    cg = CompactRankedGraph.from_graph(G, top_nodes=top_nodes)
+    result["conversion_time"] = time.perf_counter() - start
+    result["phases"] = []
+    mate = compact_graph.solve(cg, on_phase=result["phases"].append)
+    result["signature"] = {str(rank): count for rank, count in cg.signature(mate).items()}
+    return result
+
+
+def run(workloads, sizes, seed=0, output=None, log=sys.stderr):
+    """Runs every workload at every size, writes the JSON report to `output`."""
+    report = {"python": platform.python_version(), "networkx": nx.__version__, "numpy": np.__version__,
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": []}
+    for name in workloads:
+        for size in sizes:
+            result = run_case(name, size, seed)
+            report["results"].append(result)
+            print(f"{name:20} {size:>9} edges  {result['wall_time']:8.3f} s  "
+                  f"{result['peak_memory'] / 2 ** 20:8.1f} MiB", file=log)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def compare(report, baseline, log=sys.stdout):
+    """Prints the wall time ratio of every case of `report` to the same case of `baseline`."""
+    before = {(r["workload"], r["size"], r["seed"]): r for r in baseline["results"]}
+    for result in report["results"]:
+        old = before.get((result["workload"], result["size"], result["seed"]))
+        if old is not None:
+            print(f"{result['workload']:20} {result['size']:>9} edges  "
+                  f"time x{result['wall_time'] / old['wall_time']:.2f}  "
+                  f"memory x{result['peak_memory'] / max(old['peak_memory'], 1):.2f}", file=log)
+
+
+def compare_methods(workloads, sizes, seed=0, log=sys.stdout):
+    """Times solve with every engine and with "auto" on every workload and size,
+    prints the times and the ratio of auto to the fastest fixed engine."""
+    methods = list(compact_graph.ENGINES) + ["auto"]
+    rows = []
+    print(f"{'':30}" + "".join(f"{method:>17}" for method in methods) + "  auto/best", file=log)
+    for name in workloads:
+        for size in sizes:
+            G = workload_graph(name, size, seed)
+            cg = CompactRankedGraph.from_graph(G, top_nodes=[node for node in G if node[0] == "a"])
+            times = {}
+            for method in methods:
+                start = time.perf_counter()
+                compact_graph.solve(cg, method=method)
+                times[method] = time.perf_counter() - start
+            rows.append({"workload": name, "size": size, "seed": seed, "times": times})
+            best = min(times[method] for method in compact_graph.ENGINES)
+            print(f"{name:20} {size:>9}" + "".join(f"{times[method]:17.3f}" for method in methods) +
+                  f"  {times['auto'] / best:9.2f}", file=log)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of rank_maximal_matching on synthetic graphs")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000],
+                        help="approximate numbers of edges (up to 10**6)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.json", help="JSON report file")
+    parser.add_argument("--compare", help="JSON report of an earlier run")
+    parser.add_argument("--methods", action="store_true", help="time every matching engine instead")
+    args = parser.parse_args(argv)
+    if args.methods:
+        compare_methods(args.workloads, args.sizes, args.seed)
+        return
+    report = run(args.workloads, args.sizes, args.seed, args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+"""
+Checkpoints of the phases of the algorithm, so a run of hours on a large graph
+survives a restart of its worker.
+    Between two phases the whole state of `compact_graph.solve` is the number
+    of completed phases, the matching (the mate array) and the pruned edge set
+    (the alive mask), so a checkpoint is these two arrays as .npy files, which
+    can be memory mapped, and a small state.json. The arrays of every phase are
+    written to new files, flushed to disk, and then state.json is replaced
+    atomically to point to them, so a crash at any moment leaves the previous
+    complete checkpoint or the new one. The engines are deterministic, so a
+    resumed run returns exactly the matching of an uninterrupted one.
+    The state records a fingerprint of the compact graph (node order and edge
+    arrays, which the mate array and the alive mask are indexed by) and the
+    method, a checkpoint is only resumed by a run on the same graph.
+        >>> M = rank_maximal_matching(G, top_nodes=applicants, checkpoint="run-42")
+        ... (the worker restarts)
+        >>> M = resume_rank_maximal_matching(G, "run-42", top_nodes=applicants)
+"""
+
+STATE = "state.json"
+
+
+def fingerprint(cg):
+    """
+    cg - CompactRankedGraph
+    return - hex digest of the node labels, their sides and the edge arrays, in order
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for start in range(0, cg.n, 65536):
+        digest.update(repr(cg.nodes[start:start + 65536]).encode())
+    for array in (cg.is_left, cg.tails, cg.heads, cg.ranks):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Directory holding the checkpoint of a run of `compact_graph.solve`.
+
+    Parameters
+    ----------
+    directory : str or path-like
+      Created if it does not exist
+    interval : float, optional (default=0)
+      Minimum number of seconds between two saves, the phases that end sooner
+      are not saved (the last phase always is)
+
+    Notes
+    -----
+    Every save writes the mate array (n integers) and the alive mask (m bytes)
+    and fsyncs them, tens of milliseconds, small next to the phases of the
+    graphs worth checkpointing. `interval` bounds the cost for graphs with
+    many short phases.
+    """
+
+    def __init__(self, directory, interval=0):
+        self.directory = os.fspath(directory)
+        self.interval = interval
+        os.makedirs(self.directory, exist_ok=True)
+        self._graph = self._fingerprint = None
+        self._saved = time.monotonic()
+
+    def state(self):
+        """Returns the dictionary of state.json, None if there is no checkpoint."""
+        try:
+            with open(os.path.join(self.directory, STATE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(self, cg, method, mmap_mode=None):
+        """Returns (completed phases, mate, alive) of the checkpoint of `cg`, None if there is none.
+
+        Raises ValueError if the checkpoint is of another graph or method.
+        """
+        state = self.state()
+        if state is None:
+            return None
+        if state["fingerprint"] != self._fingerprint_of(cg):
+            raise ValueError(f"The checkpoint in {self.directory} is of another graph")
+        if state["method"] != method:
+            raise ValueError(f"The checkpoint in {self.directory} was written with method {state['method']!r}")
+        mate = np.load(os.path.join(self.directory, state["mate"]), mmap_mode=mmap_mode)
+        alive = np.load(os.path.join(self.directory, state["alive"]), mmap_mode=mmap_mode)
+        return state["phase"], mate, alive
+
+    def save(self, cg, phase, mate, alive, method):
+        """Writes the state after `phase` completed phases of `cg`, replacing the previous checkpoint."""
+        if phase < len(cg.rank_values) and time.monotonic() - self._saved < self.interval:
+            return
+        previous = self.state()
+        names = {"mate": f"mate-{phase}.npy", "alive": f"alive-{phase}.npy"}
+        for key, array in (("mate", mate), ("alive", alive)):
+            self._write(names[key], lambda f, array=array: np.save(f, array))
+        state = {"phase": phase, "rank": cg.rank_values[phase - 1].item() if phase else None,
+                 "phases": len(cg.rank_values), "n": cg.n, "m": cg.m,
+                 "fingerprint": self._fingerprint_of(cg), "method": method, **names}
+        self._write(STATE, lambda f: f.write(json.dumps(state).encode()))
+        if previous is not None:
+            for key in ("mate", "alive"):
+                if previous[key] != names[key]:
+                    self._remove(previous[key])
+        self._saved = time.monotonic()
+
+    def clear(self):
+        """Removes the checkpoint."""
+        state = self.state()
+        if state is not None:
+            self._remove(STATE)
+            self._remove(state["mate"])
+            self._remove(state["alive"])
+
+    def _fingerprint_of(self, cg):
+        if self._graph is not cg:
+            self._graph, self._fingerprint = cg, fingerprint(cg)
+        return self._fingerprint
+
+    def _write(self, name, write):
+        """writes a temporary file with `write`, flushes it to disk and renames it to `name`"""
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
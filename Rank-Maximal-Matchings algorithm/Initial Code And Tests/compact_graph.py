@@ -0,0 +1,943 @@
+import collections
+import functools
+import numbers
+import time
+
+import numpy as np
+import networkx as nx
+from networkx.algorithms.bipartite import sets as bipartite_sets
+
+"""
+Compact, array backed representation of a ranked bipartite graph and the phases
+of the rank-maximal matching algorithm running on it.
+    The nodes are relabeled to the integers 0..n-1 and every edge gets an id
+    0..m-1, edges are sorted by rank so the edges of rank `rank_i` are the slice
+    ``rank_starts[k]:rank_starts[k + 1]`` with ``rank_values[k] == rank_i``.
+    The adjacency is stored in CSR form: the ids of the edges incident to node u
+    are ``adjacent_edges[indptr[u]:indptr[u + 1]]``, in increasing order of rank,
+    so the edges of Gi are a prefix of every adjacency list.
+    The graph itself is never modified by the algorithm, the deleted edges are
+    cleared in a per-edge `alive` mask and the matching is a `mate` array
+    (``mate[u] == v`` if u is matched to v and -1 if u is free).
+    Inner loops index the arrays through memoryviews, which is much faster than
+    indexing NumPy arrays element by element and does not copy them.
+"""
+
+
+EVEN, ODD, UNREACHABLE = 0, 1, 2
+
+
+def _index_dtype(size):
+    return np.int32 if size < np.iinfo(np.int32).max else np.int64
+
+
+def _unique_edges(n, tails, heads, ranks):
+    """
+    keeps one edge of every (tail, head) pair, the one of the best (lowest)
+    rank, as a networkx graph keeps one edge per pair
+    n - number of nodes
+    return - tails, heads, ranks without the repeated pairs (the given arrays
+             if there are none)
+    """
+    tails, heads, ranks = np.asarray(tails), np.asarray(heads), np.asarray(ranks)
+    order = np.argsort(ranks, kind="stable")
+    _, first = np.unique(tails[order].astype(np.int64) * n + heads[order], return_index=True)
+    if len(first) == len(ranks):
+        return tails, heads, ranks
+    kept = order[np.sort(first)]
+    return tails[kept], heads[kept], ranks[kept]
+
+
+class CompactRankedGraph:
+    """
+    nodes - list of the original labels, ``nodes[u]`` is the label of node u
+    index - dictionary from an original label to its integer node
+    is_left - bool array, True for the nodes of the top side
+    tails, heads - arrays, edge e joins the left node tails[e] to the right node heads[e]
+    ranks - array, the rank of every edge, sorted in increasing order, with
+            the dtype of the given ranks (integer or floating point)
+    rank_values, rank_starts - the ranks that occur and where their edges start
+    indptr, adjacent_edges - CSR adjacency of the nodes
+    capacities - array with the number of edges every node may be matched
+                 with, None if every node has capacity 1
+    """
+
+    def __init__(self, nodes, is_left, tails, heads, ranks, capacities=None):
+        self.nodes = nodes
+        self.n = len(nodes)
+        self.capacities = None if capacities is None else np.asarray(capacities, dtype=np.int64)
+        self.m = len(ranks)
+        self.is_left = np.asarray(is_left, dtype=bool)
+        order = np.argsort(ranks, kind="stable")
+        node_dtype = _index_dtype(self.n)
+        self.tails = np.asarray(tails)[order].astype(node_dtype, copy=False)
+        self.heads = np.asarray(heads)[order].astype(node_dtype, copy=False)
+        self.ranks = np.asarray(ranks)[order]
+        del order
+        self.rank_values, self.rank_starts = np.unique(self.ranks, return_index=True)
+        self.rank_starts = np.append(self.rank_starts, self.m)
+        # CSR adjacency, a stable sort keeps every adjacency list in rank order
+        edge_dtype = _index_dtype(2 * self.m)
+        endpoints = np.concatenate((self.tails, self.heads))
+        order = np.argsort(endpoints, kind="stable")
+        self.adjacent_edges = (order % self.m).astype(edge_dtype) if self.m else order.astype(edge_dtype)
+        self.indptr = np.zeros(self.n + 1, dtype=edge_dtype)
+        np.cumsum(np.bincount(endpoints, minlength=self.n), out=self.indptr[1:])
+
+    @functools.cached_property
+    def index(self):
+        return {node: u for u, node in enumerate(self.nodes)}
+
+    @classmethod
+    def from_graph(cls, G, rank="rank", top_nodes=None, capacity=None):
+        """
+        G - bipartite networkx graph with a `rank` attribute on every edge
+        top_nodes - nodes of one side, needed if G is disconnected; may hold
+                    nodes of other graphs too, a set is used as it is
+        capacity - optional node attribute with the capacities (1 if missing)
+        """
+        if top_nodes is None:
+            left, _ = bipartite_sets(G)
+        else:
+            # not bipartite_sets(G, top_nodes), which copies top_nodes and all the nodes of G
+            top = top_nodes if isinstance(top_nodes, (set, frozenset)) else set(top_nodes)
+            left = {node for node in G if node in top}
+        nodes = list(G)
+        index = {node: u for u, node in enumerate(nodes)}
+        is_left = np.fromiter((node in left for node in nodes), dtype=bool, count=len(nodes))
+        m = G.number_of_edges()
+        tails = np.empty(m, dtype=_index_dtype(len(nodes)))
+        heads = np.empty(m, dtype=tails.dtype)
+        ranks = []
+        for e, (u, v, rank_e) in enumerate(G.edges(data=rank)):
+            if rank_e is None:
+                raise nx.NetworkXError(f"Edge ({u}, {v}) has no attribute {rank!r}")
+            if v in left:
+                u, v = v, u
+            tails[e] = index[u]
+            heads[e] = index[v]
+            ranks.append(rank_e)
+        capacities = None
+        if capacity is not None:
+            capacities = np.empty(len(nodes), dtype=np.int64)
+            for u, node in enumerate(nodes):
+                capacity_u = G.nodes[node].get(capacity, 1)
+                # checked one by one, np.int64 would truncate 2.5 to 2
+                if not isinstance(capacity_u, numbers.Integral) or capacity_u < 0:
+                    raise nx.NetworkXError(f"Node {node} has {capacity!r} {capacity_u!r}, "
+                                           "expected a non negative integer")
+                capacities[u] = capacity_u
+        return cls(nodes, is_left, tails, heads, np.asarray(ranks), capacities)
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        edges - iterable of (top node, bottom node, rank) triples, the sides
+                are given by the positions so no bipartite coloring is needed;
+                a repeated pair is one edge, of its best rank
+        """
+        index, nodes, is_left = {}, [], []
+        tails, heads, ranks = [], [], []
+        for u, v, rank_e in edges:
+            if u not in index:
+                index[u] = len(nodes)
+                nodes.append(u)
+                is_left.append(True)
+            if v not in index:
+                index[v] = len(nodes)
+                nodes.append(v)
+                is_left.append(False)
+            tails.append(index[u])
+            heads.append(index[v])
+            ranks.append(rank_e)
+        is_left = np.array(is_left, dtype=bool)
+        tails, heads = np.array(tails, dtype=np.int64), np.array(heads, dtype=np.int64)
+        if not is_left[tails].all() or is_left[heads].any():
+            raise nx.NetworkXError("A node occurs both as a top node and as a bottom node")
+        cg = cls(nodes, is_left, *_unique_edges(len(nodes), tails, heads, ranks))
+        cg.index = index
+        return cg
+
+    def number_of_edges(self):
+        """the number of edges, as for a networkx graph"""
+        return self.m
+
+    def matching_dict(self, mate):
+        """
+        mate - mate array of a matching
+        return - the matching as a dictionary of the original labels, in both directions
+        Raises NetworkXError if a top node and a bottom node share a label, the
+        dictionary would then lose pairs (iter_matching has no such limit).
+        """
+        nodes = self.nodes
+        M = {nodes[u]: nodes[v] for u, v in enumerate(mate.tolist()) if v >= 0}
+        if len(M) < np.count_nonzero(mate >= 0):
+            raise nx.NetworkXError("A top node and a bottom node share a label, "
+                                   "the matching has no two sided dictionary (use one_sided=True)")
+        return M
+
+    def matched_edges(self, mate):
+        """
+        mate - mate array of a matching
+        return - bool array, True for the edges in the matching
+        """
+        return mate[self.tails] == self.heads
+
+    def iter_matching(self, mate):
+        """
+        mate - mate array of a matching
+        return - generator of the matched pairs (top node, bottom node) of the original labels
+        """
+        nodes = self.nodes
+        for u in np.flatnonzero(self.is_left & (mate >= 0)).tolist():
+            yield nodes[u], nodes[mate[u]]
+
+    def signature(self, mate):
+        """
+        mate - mate array of a matching
+        return - dictionary from every rank to the number of matched edges of that rank
+        """
+        values, counts = np.unique(self.ranks[self.matched_edges(mate)], return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+
+class Workspace:
+    """
+    Work arrays shared by the calls of `solve` on many graphs, so a batch of
+    small graphs does not allocate them for every graph. The buffers grow to
+    the largest graph seen and every call uses views of their first items.
+    """
+
+    def __init__(self):
+        self._mate = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._label = np.empty(0, dtype=np.int8)
+
+    def arrays(self, cg):
+        """
+        return - mate (all -1), alive (all True) and label arrays of the sizes of `cg`
+        """
+        if len(self._mate) < cg.n:
+            size = max(cg.n, 2 * len(self._mate))
+            self._mate = np.empty(size, dtype=np.int64)
+            self._label = np.empty(size, dtype=np.int8)
+        if len(self._alive) < cg.m:
+            self._alive = np.empty(max(cg.m, 2 * len(self._alive)), dtype=bool)
+        mate, alive, label = self._mate[:cg.n], self._alive[:cg.m], self._label[:cg.n]
+        mate.fill(-1)
+        alive.fill(True)
+        return mate, alive, label
+
+
+def solve(cg, on_phase=None, workspace=None, method="auto", checkpoint=None):
+    """
+    Runs the phases of the algorithm of Irving et al. on the compact graph `cg`
+    on_phase - optional callback, called after every phase with a dictionary
+               of its statistics (see `_run_phases`), None costs nothing
+    workspace - optional Workspace to take the work arrays from, the returned
+                mate array is then overwritten by the next solve using it
+    method - the engine that augments the matching in every phase, a key of
+             ENGINES or "auto" to choose one per phase (see `choose_engine`)
+    checkpoint - optional checkpoint.Checkpoint, the state is saved to it after
+                 every phase and, if it holds a checkpoint of cg, the run
+                 continues after its last completed phase
+    return - mate array of a rank maximal matching
+    """
+    if method != "auto" and method not in ENGINES:
+        raise ValueError(f"Unknown method {method!r}, expected 'auto' or one of {', '.join(ENGINES)}")
+    if workspace is None:
+        mate = np.full(cg.n, -1, dtype=cg.tails.dtype)
+        alive = np.ones(cg.m, dtype=bool)
+        label = None
+    else:
+        mate, alive, label = workspace.arrays(cg)
+    start = 0
+    if checkpoint is not None:
+        resumed = checkpoint.load(cg, method)
+        if resumed is not None:
+            start, mate[:], alive[:] = resumed[0], resumed[1], resumed[2]
+    _run_phases(cg, mate, alive, label, method, start, on_phase, checkpoint)
+    return mate
+
+
+def _run_phases(cg, mate, alive, label, method, first=0, on_phase=None, checkpoint=None, deadline=None):
+    """
+    runs the phases first, first + 1, ... of the algorithm on mate and alive
+    on_phase - optional callback, called after every phase with a dictionary of:
+        rank - the rank of the phase
+        edges_added - number of edges of that rank
+        method - the engine of the augmentation
+        augmentations - number of augmenting paths
+        matching_size - size of the matching after the augmentation
+        even, odd, unreachable - sizes of the sets (None in the last phase)
+        pruned - number of edges removed by prune (None in the last phase)
+        augment_time, decompose_time, prune_time - seconds spent in every step
+        checkpoint_time - seconds spent saving the checkpoint (0 without one)
+    deadline - optional time.perf_counter() value, a phase is started only if
+               the longest phase so far still fits (the first one if any time is left)
+    return - number of completed phases
+    """
+    rank_values = cg.rank_values.tolist()
+    last = len(rank_values) - 1
+    longest = 0.0
+    for k in range(first, last + 1):
+        rank_i = rank_values[k]
+        if deadline is not None:
+            phase_start = time.perf_counter()
+            if phase_start + longest >= deadline:
+                return k
+        engine = choose_engine(cg, mate, k) if method == "auto" else method
+        if on_phase is not None:
+            stats = {"rank": rank_i, "edges_added": int(cg.rank_starts[k + 1] - cg.rank_starts[k]), "method": engine,
+                     "augmentations": 0, "augment_time": 0.0, "matching_size": 0,
+                     "even": None, "odd": None, "unreachable": None, "pruned": None,
+                     "decompose_time": 0.0, "prune_time": 0.0, "checkpoint_time": 0.0}
+            start = time.perf_counter()
+        augmentations = ENGINES[engine](cg, mate, alive, rank_i)
+        if on_phase is not None:
+            stats["augment_time"] = time.perf_counter() - start
+            stats["augmentations"] = augmentations
+            stats["matching_size"] = int(np.count_nonzero(cg.is_left & (mate >= 0)))
+        if k < last:
+            if on_phase is not None:
+                start = time.perf_counter()
+            label = decompose(cg, mate, alive, rank_i, out=label)
+            if on_phase is not None:
+                stats["decompose_time"] = time.perf_counter() - start
+                stats["even"], stats["odd"], stats["unreachable"] = np.bincount(label, minlength=3).tolist()
+                alive_before = int(np.count_nonzero(alive))
+                start = time.perf_counter()
+            prune(cg, alive, label, rank_i)
+            if on_phase is not None:
+                stats["prune_time"] = time.perf_counter() - start
+                stats["pruned"] = alive_before - int(np.count_nonzero(alive))
+        if checkpoint is not None:
+            start = time.perf_counter()
+            checkpoint.save(cg, k + 1, mate, alive, method)
+            if on_phase is not None:
+                stats["checkpoint_time"] = time.perf_counter() - start
+        if on_phase is not None:
+            on_phase(stats)
+        if deadline is not None:
+            longest = max(longest, time.perf_counter() - phase_start)
+    return len(rank_values)
+
+
+def solve_within(cg, deadline, method="auto"):
+    """
+    solve, stopping before a phase that would end after `deadline`, and then
+    completing the matching greedily with the edges of the remaining ranks
+    deadline - time.perf_counter() value, a phase is started only if the
+               longest phase so far still fits (the first one if any time is left)
+    return - (mate array, number of completed phases k); the numbers of matched
+             edges of the ranks rank_values[:k] are those of a rank maximal
+             matching, all of them if k == len(rank_values)
+    Only the greedy edges are added after phase k, every node of Ok and Uk is
+    matched so they are between nodes that were even, and the counts of the
+    ranks up to rank_values[k - 1] do not change.
+    """
+    if method != "auto" and method not in ENGINES:
+        raise ValueError(f"Unknown method {method!r}, expected 'auto' or one of {', '.join(ENGINES)}")
+    mate = np.full(cg.n, -1, dtype=cg.tails.dtype)
+    alive = np.ones(cg.m, dtype=bool)
+    k = _run_phases(cg, mate, alive, None, method, deadline=deadline)
+    if k < len(cg.rank_values):
+        greedy_complete(cg, mate, k)
+    return mate, k
+
+
+def greedy_complete(cg, mate, k):
+    """
+    adds to the matching a maximal set of edges of the ranks rank_values[k:]
+    between free nodes, rank by rank, so the better ranks are taken first
+    Every round matches, at once, the edges that are the first free edge of
+    their tail and then of their head. When many edges compete for the same
+    nodes a round matches few of them, then the rest of the rank is scanned
+    one edge at a time.
+    """
+    mate_ = mate.data
+    for start, end in zip(cg.rank_starts[k:-1].tolist(), cg.rank_starts[k + 1:].tolist()):
+        tails, heads = cg.tails[start:end], cg.heads[start:end]
+        while True:
+            free = np.flatnonzero((mate[tails] < 0) & (mate[heads] < 0))
+            if not len(free):
+                break
+            chosen = free[np.unique(tails[free], return_index=True)[1]]
+            chosen = chosen[np.unique(heads[chosen], return_index=True)[1]]
+            mate[tails[chosen]] = heads[chosen]
+            mate[heads[chosen]] = tails[chosen]
+            if 8 * len(chosen) < len(free):
+                for u, v in zip(tails[free].tolist(), heads[free].tolist()):
+                    if mate_[u] < 0 and mate_[v] < 0:
+                        mate_[u] = v
+                        mate_[v] = u
+                break
+
+
+def matched_phases(cg, mate):
+    """
+    mate - mate array of a matching made of edges of cg
+    return - array with the phase (the index in cg.rank_values) of the rank of
+             the matched edge of every node, len(cg.rank_values) for the free nodes
+    """
+    matched = np.flatnonzero(cg.matched_edges(mate))
+    phase = np.full(cg.n, len(cg.rank_values), dtype=np.int64)
+    phase[cg.tails[matched]] = phase[cg.heads[matched]] = np.searchsorted(cg.rank_values, cg.ranks[matched])
+    return phase
+
+
+def verify(cg, mate):
+    """
+    Checks that the matching `mate` of cg is rank maximal by the phases of the
+    algorithm without the augmentations: in every phase the matched edges of
+    rank at most rank_i must be a maximum matching of G'i, then G'i is pruned
+    by the labels of that matching (all the maximum matchings of G'i give the
+    same even/odd/unreachable sets). A maximum matching of G'i matches every
+    odd and unreachable node with an edge of rank at most rank_i and has no
+    OO or OU edges, so the pruning never removes a matched edge.
+    The labels come from the BFS of decompose, from the free nodes of both
+    sides, and the matching is maximum exactly when that BFS finds no node
+    from both sides: no edge joins two even nodes and no matched edge two
+    odd ones (the alternating paths that reach its ends start at free nodes
+    of the two sides and with the edge form an augmenting path). So every
+    phase costs one BFS and a vectorized check, the path itself is searched
+    for only in the phase that fails.
+    mate - mate array of a matching made of edges of cg
+    return - None if it is rank maximal, otherwise (rank_i, nodes of an
+             augmenting path of G'i)
+    """
+    match_phase = matched_phases(cg, mate)
+    alive = np.ones(cg.m, dtype=bool)
+    label = None
+    for k, rank_i in enumerate(cg.rank_values.tolist()):
+        mate_i = np.where(match_phase <= k, mate, -1)
+        label = decompose(cg, mate_i, alive, rank_i, out=label)
+        end = cg.rank_starts[k + 1]
+        even, odd = label == EVEN, label == ODD
+        if odd[mate_i[odd]].any() or (alive[:end] & even[cg.tails[:end]] & even[cg.heads[:end]]).any():
+            return rank_i, _augmenting_path(cg, mate_i, alive, rank_i)
+        prune(cg, alive, label, rank_i)
+    return None
+
+
+def _augmenting_path(cg, mate, alive, rank_i):
+    """
+    return - the nodes of a shortest augmenting path of `mate` in G'i, from a
+             free left node to a free right node, None if `mate` is maximum
+    """
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    heads, alive_mv, mate_mv = cg.heads.data, alive.data, mate.data
+    free = np.flatnonzero(cg.is_left & (mate < 0)).tolist()
+    via = dict.fromkeys(free, -1)  # left node -> the left node its mate was reached from
+    queue = collections.deque(free)
+    while queue:
+        u = queue.popleft()
+        for idx in range(indptr[u], indptr[u + 1]):
+            e = adjacent[idx]
+            if ranks[e] > rank_i:
+                break
+            if not alive_mv[e]:
+                continue
+            v = heads[e]
+            w = mate_mv[v]
+            if w < 0:
+                path = [v, u]
+                while via[u] >= 0:
+                    path.append(mate_mv[u])
+                    u = via[u]
+                    path.append(u)
+                return path[::-1]
+            if w not in via:
+                via[w] = u
+                queue.append(w)
+    return None
+
+
+def solve_capacitated(cg):
+    """
+    Runs the phases of the algorithm on the compact graph `cg` with node
+    capacities (cg.capacities), without cloning the nodes: the matching is a
+    per-edge `matched` mask and every node has a `load` (its matched edges).
+    return - the matched mask of a rank maximal matching
+    """
+    matched = np.zeros(cg.m, dtype=bool)
+    load = np.zeros(cg.n, dtype=np.int64)
+    alive = np.ones(cg.m, dtype=bool)
+    last = len(cg.rank_values) - 1
+    for k, rank_i in enumerate(cg.rank_values.tolist()):
+        augment_capacitated(cg, matched, load, alive, rank_i)
+        if k < last:
+            label = decompose_capacitated(cg, matched, load, alive, rank_i)
+            prune(cg, alive, label, rank_i)
+    return matched
+
+
+def augment_capacitated(cg, matched, load, alive, rank_i):
+    """
+    Augments the capacitated matching (`matched`, `load`) into a maximum one
+    of G'i by Hopcroft-Karp phases. A left node starts a path while it is under
+    its capacity, a path ends at a right node under its capacity and goes
+    from a saturated right node back to the left through one of its matched
+    edges, as it would through the copy of the node matched with that edge.
+    return - the number of augmenting paths
+    """
+    INFINITY = cg.n + 1
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    tails, heads, alive_mv = cg.tails.data, cg.heads.data, alive.data
+    matched_mv, load_mv, capacity = matched.data, load.data, cg.capacities.data
+    free = np.flatnonzero(cg.is_left & (load < cg.capacities)).tolist()
+    augmentations = 0
+    distances = {}
+    while free:
+        distances.clear()
+        for u in free:
+            distances[u] = 0
+        queue = collections.deque(free)
+        expanded = set()
+        shortest = INFINITY
+        while queue:
+            u = queue.popleft()
+            if distances[u] >= shortest:
+                continue
+            for idx in range(indptr[u], indptr[u + 1]):
+                e = adjacent[idx]
+                if ranks[e] > rank_i:
+                    break
+                if not alive_mv[e] or matched_mv[e]:
+                    continue
+                v = heads[e]
+                if load_mv[v] < capacity[v]:
+                    shortest = distances[u] + 1
+                elif v not in expanded:
+                    expanded.add(v)
+                    for jdx in range(indptr[v], indptr[v + 1]):
+                        f = adjacent[jdx]
+                        w = tails[f]
+                        if matched_mv[f] and w not in distances:
+                            distances[w] = distances[u] + 1
+                            queue.append(w)
+        if shortest == INFINITY:
+            break
+        dead = set()  # (saturated right node, layer) without a way on in this phase
+        for u in free:
+            found = True
+            while found and load_mv[u] < capacity[u]:
+                found = False
+                # frames [node, position in its adjacency list, edge used to reach it]
+                stack = [[u, indptr[u], -1]]
+                while stack:
+                    top = stack[-1]
+                    node, end = top[0], indptr[top[0] + 1]
+                    is_left = len(stack) % 2 == 1
+                    depth = distances[stack[-1 if is_left else -2][0]] + 1
+                    advanced = False
+                    while top[1] < end:
+                        e = adjacent[top[1]]
+                        top[1] += 1
+                        if is_left:
+                            if ranks[e] > rank_i:
+                                break
+                            if not alive_mv[e] or matched_mv[e]:
+                                continue
+                            v = heads[e]
+                            if load_mv[v] < capacity[v]:
+                                if depth == shortest:
+                                    for frame in stack[1:]:
+                                        matched_mv[frame[2]] = not matched_mv[frame[2]]
+                                    matched_mv[e] = True
+                                    load_mv[u] += 1
+                                    load_mv[v] += 1
+                                    augmentations += 1
+                                    found = advanced = True
+                                    stack = []
+                                    break
+                            elif (v, depth) not in dead:
+                                stack.append([v, indptr[v], e])
+                                advanced = True
+                                break
+                        elif ranks[e] > rank_i:
+                            break
+                        elif matched_mv[e] and distances.get(tails[e]) == depth:
+                            w = tails[e]
+                            stack.append([w, indptr[w], e])
+                            advanced = True
+                            break
+                    if not advanced:
+                        if is_left:
+                            distances[node] = INFINITY
+                        else:
+                            dead.add((node, depth))
+                        stack.pop()
+        free = [u for u in free if load_mv[u] < capacity[u]]
+    return augmentations
+
+
+def decompose_capacitated(cg, matched, load, alive, rank_i):
+    """
+    Divides the nodes by alternating paths in G'i from the nodes under their
+    capacity. An even node reaches its unlabeled neighbors through any edge
+    (its unmatched copies do), an odd node is saturated and reaches the nodes
+    it is matched with.
+    return - int8 array with the label EVEN, ODD or UNREACHABLE of every node
+    """
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    tails, heads, alive_mv, matched_mv = cg.tails.data, cg.heads.data, alive.data, matched.data
+    label = np.full(cg.n, UNREACHABLE, dtype=np.int8)
+    free = np.flatnonzero(load < cg.capacities)
+    label[free] = EVEN
+    label_mv = label.data
+    queue = collections.deque(free.tolist())
+    while queue:
+        parent = queue.popleft()
+        parent_is_odd = label_mv[parent] == ODD
+        for idx in range(indptr[parent], indptr[parent + 1]):
+            e = adjacent[idx]
+            if ranks[e] > rank_i:
+                break
+            if not alive_mv[e] or (parent_is_odd and not matched_mv[e]):
+                continue
+            child = tails[e] + heads[e] - parent
+            if label_mv[child] == UNREACHABLE:
+                label_mv[child] = EVEN if parent_is_odd else ODD
+                queue.append(child)
+    return label
+
+
+def augment(cg, mate, alive, rank_i):
+    """
+    Augments `mate` into a maximum matching of G'i (the alive edges of rank at
+    most rank_i) by Hopcroft-Karp phases from the free left vertices.
+    return - the number of augmenting paths
+    """
+    INFINITY = cg.n + 1
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    tails, heads, alive_mv, mate_mv = cg.tails.data, cg.heads.data, alive.data, mate.data
+    free = np.flatnonzero(cg.is_left & (mate < 0)).tolist()
+    n_free = len(free)
+    distances = {}
+    while free:
+        distances.clear()
+        for u in free:
+            distances[u] = 0
+        queue = collections.deque(free)
+        shortest = INFINITY
+        while queue:
+            u = queue.popleft()
+            if distances[u] >= shortest:
+                continue
+            for idx in range(indptr[u], indptr[u + 1]):
+                e = adjacent[idx]
+                if ranks[e] > rank_i:
+                    break
+                if not alive_mv[e]:
+                    continue
+                w = mate_mv[heads[e]]
+                if w < 0:
+                    shortest = distances[u] + 1
+                elif w not in distances:
+                    distances[w] = distances[u] + 1
+                    queue.append(w)
+        if shortest == INFINITY:
+            break
+        for u in free:
+            # stack of [left node, position in its adjacency list]
+            stack = [[u, indptr[u]]]
+            through = []
+            while stack:
+                top = stack[-1]
+                parent, end = top[0], indptr[top[0] + 1]
+                depth = distances[parent] + 1
+                advanced = False
+                while top[1] < end:
+                    e = adjacent[top[1]]
+                    top[1] += 1
+                    if ranks[e] > rank_i:
+                        break
+                    if not alive_mv[e]:
+                        continue
+                    v = heads[e]
+                    w = mate_mv[v]
+                    if w < 0:
+                        if depth == shortest:
+                            through.append(v)
+                            for (a, _), p in zip(stack, through):
+                                mate_mv[a] = p
+                                mate_mv[p] = a
+                            stack = []
+                            advanced = True
+                            break
+                    elif distances.get(w) == depth:
+                        through.append(v)
+                        stack.append([w, indptr[w]])
+                        advanced = True
+                        break
+                if not advanced:
+                    distances[parent] = INFINITY
+                    stack.pop()
+                    if through:
+                        through.pop()
+        free = [u for u in free if mate_mv[u] < 0]
+    return n_free - len(free)
+
+
+def augment_dfs(cg, mate, alive, rank_i):
+    """
+    Augments `mate` into a maximum matching of G'i with a greedy pass, which
+    matches free left vertices to free right neighbors, and then one depth
+    first search for an augmenting path from every free left vertex left.
+    The right vertices seen by a failed search can not reach a free vertex
+    for the rest of the phase (the augmentations never pass through them), so
+    they are not searched again.
+    return - the number of augmenting paths
+    """
+    DEAD = -2
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    heads, alive_mv, mate_mv = cg.heads.data, alive.data, mate.data
+    free = np.flatnonzero(cg.is_left & (mate < 0)).tolist()
+    searching = []
+    for u in free:
+        for idx in range(indptr[u], indptr[u + 1]):
+            e = adjacent[idx]
+            if ranks[e] > rank_i:
+                break
+            if alive_mv[e] and mate_mv[heads[e]] < 0:
+                v = heads[e]
+                mate_mv[u] = v
+                mate_mv[v] = u
+                break
+        if mate_mv[u] < 0:
+            searching.append(u)
+    seen = [-1] * cg.n  # number of the search that reached a right vertex, or DEAD
+    for search, u in enumerate(searching):
+        # stack of [left node, position in its adjacency list]
+        stack = [[u, indptr[u]]]
+        through = []
+        visited = []
+        while stack:
+            top = stack[-1]
+            end = indptr[top[0] + 1]
+            advanced = False
+            while top[1] < end:
+                e = adjacent[top[1]]
+                top[1] += 1
+                if ranks[e] > rank_i:
+                    break
+                v = heads[e]
+                if not alive_mv[e] or seen[v] == search or seen[v] == DEAD:
+                    continue
+                seen[v] = search
+                visited.append(v)
+                through.append(v)
+                w = mate_mv[v]
+                if w < 0:
+                    for (a, _), p in zip(stack, through):
+                        mate_mv[a] = p
+                        mate_mv[p] = a
+                    stack = []
+                    visited = []
+                else:
+                    stack.append([w, indptr[w]])
+                advanced = True
+                break
+            if not advanced:
+                stack.pop()
+                if through:
+                    through.pop()
+        for v in visited:
+            seen[v] = DEAD
+    return len(free) - int(np.count_nonzero(mate[free] < 0)) if free else 0
+
+
+def augment_push_relabel(cg, mate, alive, rank_i):
+    """
+    Augments `mate` into a maximum matching of G'i by the double push
+    algorithm: an active (free) left vertex takes the right neighbor v with
+    the smallest distance label, the previous mate of v becomes active, and v
+    is relabeled to one more than the second smallest label. The labels of
+    the right vertices are lower bounds of their alternating distance to a
+    free right vertex, a left vertex whose neighbors are all at distance n or
+    more has no augmenting path and is dropped. The labels are recomputed
+    exactly (`_distance_labels`) at the start and after every n relabels.
+    The pushes also move matched vertices, so the result is a maximum
+    matching but not necessarily one augmented from `mate`, which the rank
+    phases need: only the augmenting paths of its difference with `mate` are
+    applied to `mate` (`_keep_augmenting_paths`), still a maximum matching.
+    return - the number of augmenting paths
+    """
+    INFINITY = cg.n
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    heads, alive_mv, mate_mv = cg.heads.data, alive.data, mate.data
+    free = np.flatnonzero(cg.is_left & (mate < 0)).tolist()
+    if not free:
+        return 0
+    before = mate.copy()
+    distance = _distance_labels(cg, mate, alive, rank_i)
+    active = collections.deque(free)
+    relabels = 0
+    while active:
+        if relabels >= cg.n:
+            distance = _distance_labels(cg, mate, alive, rank_i)
+            relabels = 0
+        u = active.popleft()
+        first = second = INFINITY
+        best = -1
+        for idx in range(indptr[u], indptr[u + 1]):
+            e = adjacent[idx]
+            if ranks[e] > rank_i:
+                break
+            if not alive_mv[e]:
+                continue
+            v = heads[e]
+            if distance[v] < first:
+                first, second, best = distance[v], first, v
+            elif distance[v] < second:
+                second = distance[v]
+        if first >= INFINITY:
+            continue
+        w = mate_mv[best]
+        mate_mv[best] = u
+        mate_mv[u] = best
+        distance[best] = min(second + 1, INFINITY)
+        relabels += 1
+        if w >= 0:
+            mate_mv[w] = -1
+            active.append(w)
+    return _keep_augmenting_paths(mate, before, free)
+
+
+def _keep_augmenting_paths(mate, before, free):
+    """
+    mate - maximum matching, replaced by `before` augmented with the
+           augmenting paths of the symmetric difference of the two
+    before - the matching `mate` was computed from
+    free - the free left vertices of `before`
+    return - the number of augmenting paths
+    """
+    after = mate.copy()
+    mate[:] = before
+    after_mv, before_mv, mate_mv = after.data, before.data, mate.data
+    augmentations = 0
+    for u in free:
+        path = [u]
+        v = after_mv[u]
+        while v >= 0:
+            path.append(v)
+            w = before_mv[v]
+            if w < 0:
+                break
+            path.append(w)
+            v = after_mv[w]
+        if v >= 0:
+            # ends at a right vertex free in `before`: an augmenting path
+            for x in path:
+                mate_mv[x] = after_mv[x]
+            augmentations += 1
+    return augmentations
+
+
+def _distance_labels(cg, mate, alive, rank_i):
+    """
+    return - list with the alternating distance in G'i of every right node to
+             a free right node (by a BFS from the free right nodes), cg.n if
+             there is no alternating path
+    """
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    tails, alive_mv, mate_mv = cg.tails.data, alive.data, mate.data
+    free = ~cg.is_left & (mate < 0)
+    distance = np.where(free, 0, cg.n).tolist()
+    # free right nodes without edges have nothing to expand
+    queue = collections.deque(np.flatnonzero(free & (cg.indptr[1:] > cg.indptr[:-1])).tolist())
+    while queue:
+        v = queue.popleft()
+        for idx in range(indptr[v], indptr[v + 1]):
+            e = adjacent[idx]
+            if ranks[e] > rank_i:
+                break
+            if not alive_mv[e]:
+                continue
+            w = mate_mv[tails[e]]
+            if w >= 0 and w != v and distance[w] == cg.n:
+                distance[w] = distance[v] + 1
+                queue.append(w)
+    return distance
+
+
+ENGINES = {"hopcroft_karp": augment, "augmenting_path": augment_dfs, "push_relabel": augment_push_relabel}
+
+
+def choose_engine(cg, mate, k):
+    """
+    k - index of the phase in cg.rank_values
+    return - the name of the engine for phase k, by the free vertices of both sides:
+        augmenting_path - at least twice as many free right as free left
+                          vertices, the greedy pass matches most of them
+        hopcroft_karp - under 1% of the left vertices free, its searches
+                        stay near them while push_relabel labels the whole graph
+        push_relabel - otherwise, its labels do not search the dead ends
+                       of G'i again in every Hopcroft-Karp round
+    """
+    free = mate < 0
+    free_left = int(np.count_nonzero(free & cg.is_left))
+    free_right = int(np.count_nonzero(free)) - free_left
+    if free_right >= 2 * free_left:
+        return "augmenting_path"
+    if 100 * free_left < np.count_nonzero(cg.is_left):
+        return "hopcroft_karp"
+    return "push_relabel"
+
+
+def decompose(cg, mate, alive, rank_i, out=None):
+    """
+    Divides the nodes by alternating paths in G'i from the free vertices, with
+    one multi-source BFS over the mate array, O(n + m)
+    out - optional int8 array of size n to write the labels into
+    return - int8 array with the label EVEN, ODD or UNREACHABLE of every node
+    """
+    indptr, adjacent, ranks = cg.indptr.data, cg.adjacent_edges.data, cg.ranks.data
+    tails, heads, alive_mv, mate_mv = cg.tails.data, cg.heads.data, alive.data, mate.data
+    if out is None:
+        label = np.full(cg.n, UNREACHABLE, dtype=np.int8)
+    else:
+        label = out
+        label.fill(UNREACHABLE)
+    free = np.flatnonzero(mate < 0)
+    label[free] = EVEN
+    label_mv = label.data
+    queue = collections.deque(free.tolist())
+    while queue:
+        parent = queue.popleft()
+        if label_mv[parent] == ODD:
+            # odd nodes are matched, they continue through their matched edge
+            child = mate_mv[parent]
+            if label_mv[child] == UNREACHABLE:
+                label_mv[child] = EVEN
+                queue.append(child)
+            continue
+        for idx in range(indptr[parent], indptr[parent + 1]):
+            e = adjacent[idx]
+            if ranks[e] > rank_i:
+                break
+            if not alive_mv[e]:
+                continue
+            child = tails[e] + heads[e] - parent
+            if label_mv[child] == UNREACHABLE:
+                label_mv[child] = ODD
+                queue.append(child)
+    return label
+
+
+def prune(cg, alive, label, rank_i):
+    """
+    remove edges from Oi or Ui with rank greater than rank_i
+    remove OiUi edges
+    remove OiOi edges
+    All in one pass of vectorized masks over the edge arrays, the edges of rank
+    at most rank_i and the ones above it are contiguous since they are sorted.
+    """
+    split = np.searchsorted(cg.ranks, rank_i, side="right")
+    tail_label = label[cg.tails[:split]]
+    head_label = label[cg.heads[:split]]
+    alive[:split] &= ~(((tail_label == ODD) & (head_label != EVEN)) | ((head_label == ODD) & (tail_label != EVEN)))
+    tail_label = label[cg.tails[split:]]
+    head_label = label[cg.heads[split:]]
+    alive[split:] &= (tail_label == EVEN) & (head_label == EVEN)
@@ -0,0 +1,212 @@
+import array
+import collections
+
+import numpy as np
+import networkx as nx
+from networkx.algorithms.bipartite import sets as bipartite_sets
+
+import compact_graph
+from compact_graph import CompactRankedGraph
+
+"""
+Rank maximal matching of a ranked bipartite graph that changes over time.
+    Phase k of the algorithm (rank r_k) only looks at the edges of rank at most
+    r_k, and the edges it deletes are decided by its even/odd/unreachable
+    labels. So after a change of the edges of rank r, the phases of the ranks
+    below r are unchanged: the matcher keeps, for every phase, the matching
+    after its augmentation and its labels, replays the deletions of the
+    unchanged phases from the labels (one vectorized mask per phase) and only
+    re-runs the phases from rank r on.
+"""
+
+
+class RankMaximalMatcher:
+    """Maintains a rank maximal matching of a ranked bipartite graph under
+    edge and node updates.
+
+    Parameters
+    ----------
+    G : NetworkX graph, optional
+      Initial undirected bipartite graph with a `rank` attribute on every edge
+    rank : string, optional (default="rank")
+      Edge data key holding the ranks of `G`
+    top_nodes : container, optional
+      Nodes of one side of `G`, needed if `G` is disconnected
+
+    Examples
+    --------
+        >>> matcher = RankMaximalMatcher()
+        >>> matcher.add_edge('a1', 'p1', 2)
+        >>> matcher.add_edge('a1', 'p2', 1)
+        >>> matcher.add_edge('a2', 'p2', 2)
+        >>> matcher.matching
+        {'a1': 'p2', 'p2': 'a1'}
+        >>> matcher.change_rank('a1', 'p2', 3)
+        >>> matcher.signature
+        {2: 2}
+
+    Notes
+    -----
+    Updates are lazy, the phases are re-run when `matching` or `signature` is
+    read, from the lowest rank changed since the last read. The per-phase
+    state costs O(n) memory per rank.
+    """
+
+    def __init__(self, G=None, rank="rank", top_nodes=None):
+        self._nodes = []  # node id -> label, removed nodes stay as holes
+        self._index = {}  # label -> node id
+        self._is_left = array.array("b")
+        self._slots = {}  # (left id, right id) -> position in the edge arrays
+        self._tails, self._heads = array.array("q"), array.array("q")
+        self._ranks = []  # integer or floating point, as given
+        self._removed = bytearray()  # tombstones of the edge arrays
+        self._phases = []  # (rank, mate after the augmentation, labels) of every phase
+        self._mate = np.empty(0, dtype=np.int64)
+        self._dirty_rank = None
+        if G is not None:
+            left, right = bipartite_sets(G, top_nodes)
+            for node in G:
+                self.add_node(node, top=node in left)
+            for u, v, rank_e in G.edges(data=rank):
+                if rank_e is None:
+                    raise nx.NetworkXError(f"Edge ({u}, {v}) has no attribute {rank!r}")
+                self.add_edge(u, v, rank_e)
+
+    def add_node(self, node, top=True):
+        """Adds an isolated node to the top side (or the bottom side if `top` is False)."""
+        if node in self._index:
+            raise nx.NetworkXError(f"Node {node} is already in the graph")
+        self._index[node] = len(self._nodes)
+        self._nodes.append(node)
+        self._is_left.append(top)
+
+    def remove_node(self, node):
+        """Removes `node` and its edges."""
+        u = self._node_id(node)
+        tails, heads = np.frombuffer(self._tails, dtype=np.int64), np.frombuffer(self._heads, dtype=np.int64)
+        incident = ((tails == u) | (heads == u)) & ~np.frombuffer(self._removed, dtype=bool)
+        for tail, head in zip(tails[incident].tolist(), heads[incident].tolist()):
+            self._remove_slot(tail, head)
+        del self._index[node]
+        self._nodes[u] = None
+
+    def add_edge(self, u, v, rank):
+        """Adds the edge (u, v) with rank `rank`, or changes its rank if it exists.
+        New nodes are added, `u` to the top side and `v` to the bottom side."""
+        u_top = self._is_left[self._index[u]] if u in self._index else True
+        v_top = self._is_left[self._index[v]] if v in self._index else False
+        if u_top == v_top:
+            # checked before any node is added, a rejected edge leaves the graph unchanged
+            raise nx.NetworkXError(f"The nodes {u} and {v} are on the same side")
+        if u not in self._index:
+            self.add_node(u, top=True)
+        if v not in self._index:
+            self.add_node(v, top=False)
+        tail, head = self._edge_key(u, v)
+        if (tail, head) in self._slots:
+            self.change_rank(u, v, rank)
+            return
+        self._slots[tail, head] = len(self._ranks)
+        self._tails.append(tail)
+        self._heads.append(head)
+        self._ranks.append(rank)
+        self._removed.append(False)
+        self._touch(rank)
+
+    def remove_edge(self, u, v):
+        """Removes the edge (u, v)."""
+        tail, head = self._edge_key(u, v)
+        if (tail, head) not in self._slots:
+            raise nx.NetworkXError(f"The edge {u}-{v} is not in the graph")
+        self._remove_slot(tail, head)
+
+    def change_rank(self, u, v, rank):
+        """Sets the rank of the edge (u, v) to `rank`."""
+        tail, head = self._edge_key(u, v)
+        if (tail, head) not in self._slots:
+            raise nx.NetworkXError(f"The edge {u}-{v} is not in the graph")
+        slot = self._slots[tail, head]
+        self._touch(min(self._ranks[slot], rank))
+        self._ranks[slot] = rank
+
+    @property
+    def matching(self):
+        """The rank maximal matching, as returned by `rank_maximal_matching`."""
+        self._repair()
+        nodes = self._nodes
+        M = {nodes[u]: nodes[v] for u, v in enumerate(self._mate.tolist()) if v >= 0}
+        if len(M) < np.count_nonzero(self._mate >= 0):
+            raise nx.NetworkXError("A top node and a bottom node share a label, "
+                                   "the matching has no two sided dictionary")
+        return M
+
+    @property
+    def signature(self):
+        """Dictionary from every rank to the number of matched edges of that rank."""
+        self._repair()
+        tails, heads, ranks = self._edge_arrays()
+        counts = collections.Counter(ranks[self._mate[tails] == heads].tolist()) if len(tails) else {}
+        return {rank_i: counts[rank_i] for rank_i in sorted(counts)}
+
+    def _node_id(self, node):
+        if node not in self._index:
+            raise nx.NetworkXError(f"The node {node} is not in the graph")
+        return self._index[node]
+
+    def _edge_key(self, u, v):
+        tail, head = self._node_id(u), self._node_id(v)
+        if self._is_left[tail] == self._is_left[head]:
+            raise nx.NetworkXError(f"The nodes {u} and {v} are on the same side")
+        return (tail, head) if self._is_left[tail] else (head, tail)
+
+    def _remove_slot(self, tail, head):
+        slot = self._slots.pop((tail, head))
+        self._removed[slot] = True
+        self._touch(self._ranks[slot])
+        if 2 * len(self._slots) < len(self._removed):
+            self._compact()
+
+    def _compact(self):
+        """drops the tombstones of the edge arrays"""
+        tails, heads, ranks = self._edge_arrays()
+        self._tails = array.array("q", tails.tobytes())
+        self._heads = array.array("q", heads.tobytes())
+        self._ranks = ranks.tolist()
+        self._removed = bytearray(len(ranks))
+        self._slots = {(tail, head): slot for slot, (tail, head) in enumerate(zip(tails.tolist(), heads.tolist()))}
+
+    def _touch(self, rank):
+        if self._dirty_rank is None or rank < self._dirty_rank:
+            self._dirty_rank = rank
+
+    def _edge_arrays(self):
+        kept = ~np.frombuffer(self._removed, dtype=bool)
+        return (np.frombuffer(self._tails, dtype=np.int64)[kept], np.frombuffer(self._heads, dtype=np.int64)[kept],
+                np.asarray(self._ranks)[kept])
+
+    def _repair(self):
+        """re-runs the phases of the ranks not below the lowest changed rank"""
+        n = len(self._nodes)
+        if self._dirty_rank is None:
+            if len(self._mate) < n:
+                self._mate = np.append(self._mate, np.full(n - len(self._mate), -1, dtype=self._mate.dtype))
+            return
+        phases = [phase for phase in self._phases if phase[0] < self._dirty_rank]
+        self._dirty_rank = None
+        cg = CompactRankedGraph(range(n), np.frombuffer(self._is_left, dtype=np.int8), *self._edge_arrays())
+        mate = np.full(n, -1, dtype=cg.tails.dtype)
+        alive = np.ones(cg.m, dtype=bool)
+        for rank_i, phase_mate, phase_label in phases:
+            label = np.full(n, compact_graph.EVEN, dtype=np.int8)
+            label[:len(phase_label)] = phase_label
+            compact_graph.prune(cg, alive, label, rank_i)
+        if phases:
+            mate[:len(phases[-1][1])] = phases[-1][1]
+        for k in range(len(phases), len(cg.rank_values)):
+            rank_i = cg.rank_values[k].item()
+            compact_graph.ENGINES[compact_graph.choose_engine(cg, mate, k)](cg, mate, alive, rank_i)
+            label = compact_graph.decompose(cg, mate, alive, rank_i)
+            phases.append((rank_i, mate.copy(), label))
+            compact_graph.prune(cg, alive, label, rank_i)
+        self._phases = phases
+        self._mate = mate
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import numpy as np
+
+import benchmark
+from server import SolverClient, SolverError, SolverServer
+
+"""
+Load generator of the solver service (server.py).
+    `--connections` clients send `--requests` requests in total, each client
+    one at a time (closed loop), or at `--rate` requests per second overall
+    (open loop, requests do not wait for the previous answers, which is how
+    backpressure and timeouts show up). The instances are random graphs of
+    benchmark.ranked_bipartite_graph with about `--edges` edges. Without
+    --socket or --port a server with `--workers` workers is started in the
+    process. The client side latency percentiles, the errors and the
+    statistics of the server are printed as JSON.
+        python server.py --socket /tmp/rmm.sock --workers 4 &
+        python load_test.py --socket /tmp/rmm.sock --connections 16 --requests 2000 --edges 500
+        python load_test.py --workers 2 --rate 200 --timeout 0.5
+"""
+
+
+def instances(n_instances, n_edges, seed=0):
+    """Returns `n_instances` lists of (applicant, post, rank) triples of about `n_edges` edges."""
+    result = []
+    for k in range(n_instances):
+        G = benchmark.workload_graph("few_ranks_ties", n_edges, seed + k)
+        result.append([(u, v, rank) if u[0] == "a" else (v, u, rank) for u, v, rank in G.edges(data="rank")])
+    # the labels travel as JSON, tuples become strings
+    return [[(f"{u[0]}{u[1]}", f"{v[0]}{v[1]}", rank) for u, v, rank in edges] for edges in result]
+
+
+async def run(args):
+    server = None
+    if args.socket is None and args.port is None:
+        server = SolverServer(args.workers, args.max_pending)
+        host, port = await server.start(port=0)
+        serving = asyncio.ensure_future(server.serve_forever())
+        clients = [await SolverClient.connect(host=host, port=port) for _ in range(args.connections)]
+    else:
+        clients = [await SolverClient.connect(path=args.socket, port=args.port) for _ in range(args.connections)]
+    pool = instances(args.instances, args.edges, args.seed)
+    latencies, errors = [], collections.Counter()
+
+    async def one(client, k):
+        start = time.perf_counter()
+        try:
+            await client.solve(pool[k % len(pool)], timeout=args.timeout)
+            latencies.append(time.perf_counter() - start)
+        except SolverError as error:
+            errors[str(error).split(":")[0]] += 1
+
+    start = time.perf_counter()
+    if args.rate:
+        tasks = []
+        for k in range(args.requests):
+            tasks.append(asyncio.ensure_future(one(clients[k % len(clients)], k)))
+            await asyncio.sleep(max(0.0, start + (k + 1) / args.rate - time.perf_counter()))
+        await asyncio.gather(*tasks)
+    else:
+        async def closed_loop(c):
+            for k in range(c, args.requests, len(clients)):
+                await one(clients[c], k)
+
+        await asyncio.gather(*(closed_loop(c) for c in range(len(clients))))
+    elapsed = time.perf_counter() - start
+    report = {"requests": args.requests, "completed": len(latencies), "errors": dict(errors),
+              "seconds": elapsed, "throughput": len(latencies) / elapsed}
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]).tolist()
+        report["latency"] = {"p50": p50, "p90": p90, "p99": p99, "max": max(latencies)}
+    report["server"] = await clients[0].stats()
+    for client in clients:
+        await client.close()
+    if server is not None:
+        serving.cancel()
+        await server.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the rank maximal matching server")
+    parser.add_argument("--socket", help="Unix socket of a running server")
+    parser.add_argument("--port", type=int, help="localhost TCP port of a running server")
+    parser.add_argument("--workers", type=int, help="workers of the in-process server (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rate", type=float, help="requests per second (default: closed loop)")
+    parser.add_argument("--edges", type=int, default=200, help="approximate number of edges of an instance")
+    parser.add_argument("--instances", type=int, default=20, help="distinct instances, sent in turn")
+    parser.add_argument("--timeout", type=float)
+    parser.add_argument("--seed", type=int, default=0)
+    print(json.dumps(asyncio.run(run(parser.parse_args(argv))), indent=2))
+
+
+if __name__ == "__main__":
+    main()
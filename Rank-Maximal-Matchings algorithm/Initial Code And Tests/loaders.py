@@ -0,0 +1,200 @@
+import array
+import csv
+import itertools
+import os
+
+import numpy as np
+
+from compact_graph import CompactRankedGraph, _index_dtype, _unique_edges
+
+"""
+Builds the compact graph of rank_maximal_matching directly from bulk data,
+without a NetworkX graph: a scipy.sparse biadjacency matrix of ranks, NumPy
+arrays (left, right, rank), or an edge file (.npy, raw binary or CSV).
+    The labels are replaced by integers while loading, in chunks of `chunk_size`
+    edges, so besides the compact edge arrays only a chunk and the distinct
+    labels are held in memory, and memory mapped inputs are never read whole.
+    The result is a CompactRankedGraph that `rank_maximal_matching`,
+    `rank_signature` and `iter_rank_maximal_matching` accept in place of G,
+    and the matching is mapped back to the original labels only at the end.
+    A (top node, bottom node) pair given more than once is one edge, of the
+    best of its ranks, as a NetworkX graph would hold it.
+    The labels of the two sides may coincide (numbers in an edge file, for
+    example), the two sided results then raise and the one sided ones are
+    the safe ones:
+        >>> cg = read_edge_file("preferences.csv", header=True)
+        >>> M = rank_maximal_matching(cg, one_sided=True)
+"""
+
+CHUNK_SIZE = 2 ** 20
+
+
+def from_biadjacency_matrix(A, row_labels=None, column_labels=None):
+    """Returns the compact graph of a biadjacency matrix of ranks.
+
+    Parameters
+    ----------
+    A : scipy sparse matrix or array
+      ``A[i, j]`` is the rank of the edge between the top node of row i and
+      the bottom node of column j, the entries that are not stored (or zero)
+      are not edges
+    row_labels, column_labels : sequence, optional
+      Labels of the rows and the columns, by default ``("row", i)`` and
+      ``("column", j)`` so the two sides never share a label
+
+    Returns
+    -------
+    cg : CompactRankedGraph
+    """
+    n_rows, n_columns = A.shape
+    coo = A.tocoo()
+    stored = coo.data != 0
+    dtype = _index_dtype(n_rows + n_columns)
+    tails = coo.row[stored].astype(dtype)
+    heads = coo.col[stored].astype(dtype)
+    heads += n_rows
+    ranks = coo.data[stored]
+    del coo, stored
+    nodes = [("row", i) for i in range(n_rows)] if row_labels is None else list(row_labels)
+    nodes.extend((("column", j) for j in range(n_columns)) if column_labels is None else column_labels)
+    if len(nodes) != n_rows + n_columns:
+        raise ValueError("The labels do not match the shape of the matrix")
+    return CompactRankedGraph(nodes, np.arange(n_rows + n_columns) < n_rows,
+                              *_unique_edges(len(nodes), tails, heads, ranks))
+
+
+def from_edge_arrays(left, right, ranks, chunk_size=CHUNK_SIZE):
+    """Returns the compact graph of the edges ``(left[e], right[e])`` with rank ``ranks[e]``.
+
+    Parameters
+    ----------
+    left, right : array_like
+      Labels of the top and the bottom node of every edge, NumPy (possibly
+      memory mapped) arrays are read `chunk_size` items at a time
+    ranks : array_like
+      Rank of every edge, integer or floating point
+    chunk_size : int, optional
+
+    Returns
+    -------
+    cg : CompactRankedGraph
+    """
+    left, right = np.asarray(left), np.asarray(right)
+    if not len(left) == len(right) == len(ranks):
+        raise ValueError("left, right and ranks must have the same length")
+    tails, left_labels = _relabel(left, chunk_size)
+    heads, right_labels = _relabel(right, chunk_size)
+    heads += len(left_labels)
+    nodes = left_labels.tolist()
+    nodes.extend(right_labels.tolist())
+    is_left = np.arange(len(nodes)) < len(left_labels)
+    return CompactRankedGraph(nodes, is_left, *_unique_edges(len(nodes), tails, heads, ranks))
+
+
+def read_edge_file(path, format=None, label_type=str, header=False, delimiter=",", chunk_size=CHUNK_SIZE):
+    """Returns the compact graph of an edge file with a (top node, bottom node,
+    rank) record per edge.
+
+    Parameters
+    ----------
+    path : str or path-like
+    format : "npy", "binary" or "csv", optional
+      By default from the extension of `path` (.npy, .bin, anything else is
+      CSV). "npy" is a NumPy file of an integer (m, 3) array and "binary" is
+      the raw little endian int64 triples, both are memory mapped. CSV files
+      are read `chunk_size` rows at a time.
+    label_type : callable, optional (default=str)
+      Applied to the CSV labels, e.g. int
+    header : bool, optional (default=False)
+      If True the first row of a CSV file is skipped
+    delimiter : str, optional (default=",")
+    chunk_size : int, optional
+
+    Returns
+    -------
+    cg : CompactRankedGraph
+    """
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        format = {".npy": "npy", ".bin": "binary"}.get(extension, "csv")
+    if format == "npy":
+        edges = np.load(path, mmap_mode="r")
+    elif format == "binary":
+        edges = np.memmap(path, dtype="<i8", mode="r")
+        edges = edges.reshape(-1, 3)
+    elif format == "csv":
+        return _read_csv(path, label_type, header, delimiter, chunk_size)
+    else:
+        raise ValueError(f"Unknown edge file format {format!r}")
+    if edges.ndim != 2 or edges.shape[1] != 3:
+        raise ValueError(f"{path} does not hold (top node, bottom node, rank) triples")
+    return from_edge_arrays(edges[:, 0], edges[:, 1], edges[:, 2], chunk_size)
+
+
+def _read_csv(path, label_type, header, delimiter, chunk_size):
+    """
+    reads the rows in chunks, the labels are numbered in order of appearance
+    return - CompactRankedGraph
+    """
+    left_index, right_index = {}, {}
+    tails, heads, ranks = array.array("q"), array.array("q"), array.array("q")
+    with open(path, newline="") as f:
+        rows = csv.reader(f, delimiter=delimiter)
+        if header:
+            next(rows, None)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            for row in chunk:
+                if not row:
+                    continue
+                u, v, rank_e = row
+                tails.append(left_index.setdefault(label_type(u), len(left_index)))
+                heads.append(right_index.setdefault(label_type(v), len(right_index)))
+                try:
+                    ranks.append(int(rank_e))
+                except ValueError:
+                    # a fractional rank, the ranks are floating point from now on
+                    if ranks.typecode == "q":
+                        ranks = array.array("d", ranks)
+                    ranks.append(float(rank_e))
+    nodes = list(left_index)
+    nodes.extend(right_index)
+    dtype = _index_dtype(len(nodes))
+    heads = np.frombuffer(heads, dtype=np.int64).astype(dtype)
+    heads += len(left_index)
+    is_left = np.arange(len(nodes)) < len(left_index)
+    tails = np.frombuffer(tails, dtype=np.int64).astype(dtype)
+    return CompactRankedGraph(nodes, is_left,
+                              *_unique_edges(len(nodes), tails, heads, np.frombuffer(ranks, dtype=ranks.typecode)))
+
+
+def _relabel(labels, chunk_size):
+    """
+    labels - array of the labels of the edges at one side
+    return - (ids, values) ids[e] is the number of labels[e] in values, the sorted distinct labels
+    Integer labels in a range not much larger than the array are numbered with
+    a presence bitmap in two passes over chunks, other labels with np.unique.
+    """
+    m = len(labels)
+    dtype = _index_dtype(2 * m)
+    if m and np.issubdtype(labels.dtype, np.integer):
+        low, high = None, None
+        for start in range(0, m, chunk_size):
+            chunk = labels[start:start + chunk_size]
+            low = chunk.min() if low is None else min(low, chunk.min())
+            high = chunk.max() if high is None else max(high, chunk.max())
+        low, high = int(low), int(high)
+        if high - low <= 2 * m + 1024:
+            present = np.zeros(high - low + 1, dtype=bool)
+            for start in range(0, m, chunk_size):
+                present[labels[start:start + chunk_size] - low] = True
+            position = np.cumsum(present, dtype=dtype)
+            position -= 1
+            ids = np.empty(m, dtype=dtype)
+            for start in range(0, m, chunk_size):
+                ids[start:start + chunk_size] = position[labels[start:start + chunk_size] - low]
+            return ids, np.flatnonzero(present) + low
+    values, ids = np.unique(labels, return_inverse=True)
+    return ids.reshape(-1).astype(dtype), values
@@ -0,0 +1,197 @@
+import array
+import collections
+import hashlib
+import itertools
+import pickle
+import sqlite3
+import threading
+
+import numpy as np
+import networkx as nx
+from networkx.algorithms.bipartite import sets as bipartite_sets
+
+import compact_graph
+from compact_graph import CompactRankedGraph
+
+"""
+Cache of rank maximal matchings keyed by the content of the input graph.
+    The key is a canonical hash of the ranked edge set: every edge (top node,
+    bottom node, rank) is hashed on its own from 64 bit digests of the node
+    labels (so only the n labels are hashed in Python, the m edges in NumPy)
+    and the edge hashes are summed, which does not depend on the order of the
+    nodes or the edges. The side of every node (from `top_nodes`) is part of
+    the edge hash, the `rank` attribute name and the options are part of the
+    key. A NetworkX graph is hashed from its edges directly, without building
+    the compact graph, so a hit never pays for the conversion. Results are
+    kept in a bounded LRU dictionary and, optionally, in an sqlite file so
+    they survive restarts.
+"""
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "disk_hits", "evictions", "maxsize", "currsize"])
+
+_SEEDS = (0x243F6A8885A308D3, 0x13198A2E03707344)
+
+
+def _mix(x):
+    """splitmix64 finalizer of a uint64 array"""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def graph_key(G, rank="rank", top_nodes=None):
+    """
+    G - networkx graph with a `rank` attribute on every edge, or CompactRankedGraph
+    top_nodes - nodes of the top side of G, needed if G is disconnected
+    return - hex string, the same for graphs with the same ranked edges
+             (between the same top and bottom labels) in any order
+    """
+    if isinstance(G, CompactRankedGraph):
+        nodes, tails, heads, ranks = G.nodes, G.tails, G.heads, G.ranks
+    else:
+        if top_nodes is None:
+            top, _ = bipartite_sets(G)
+        else:
+            top = top_nodes if isinstance(top_nodes, (set, frozenset)) else set(top_nodes)
+        nodes = list(G)
+        index = {node: u for u, node in enumerate(nodes)}
+        # the edges from the adjacency of the top nodes, whole lists at a time
+        tails, heads, ranks = array.array("q"), array.array("q"), []
+        for u, node in enumerate(nodes):
+            if node in top:
+                neighbors = G[node]
+                tails.extend(itertools.repeat(u, len(neighbors)))
+                heads.extend([index[v] for v in neighbors])
+                ranks.extend([d.get(rank) for d in neighbors.values()])
+        if len(ranks) != G.number_of_edges():
+            raise nx.NetworkXError("Not every edge of G joins a top node to a bottom node")
+        if None in ranks:
+            e = ranks.index(None)
+            raise nx.NetworkXError(f"Edge ({nodes[tails[e]]}, {nodes[heads[e]]}) has no attribute {rank!r}")
+        tails, heads, ranks = np.frombuffer(tails, dtype=np.int64), np.frombuffer(heads, dtype=np.int64), np.asarray(ranks)
+    labels = np.frombuffer(b"".join(hashlib.blake2b(repr(node).encode(), digest_size=8).digest() for node in nodes),
+                           dtype="<u8").astype(np.uint64)
+    # the bits of the ranks, floating point ranks are not truncated
+    ranks = np.ascontiguousarray(ranks, dtype=np.float64 if ranks.dtype.kind == "f" else np.int64).view(np.uint64)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(len(ranks).to_bytes(8, "little"))
+    for seed in _SEEDS:
+        edges = _mix(labels[tails] ^ _mix(labels[heads] ^ _mix(ranks ^ np.uint64(seed))))
+        digest.update(int(edges.sum(dtype=np.uint64)).to_bytes(8, "little"))
+    return digest.hexdigest()
+
+
+class RankMaximalMatchingCache:
+    """Memoizes `rank_maximal_matching` on the content of its input.
+
+    Parameters
+    ----------
+    maxsize : int, optional (default=128)
+      Number of results kept in memory, the least recently used is evicted
+    path : str, optional
+      sqlite database file of a persistent store, every result computed is
+      written to it and the results missing in memory are looked up in it
+
+    Examples
+    --------
+        >>> cache = RankMaximalMatchingCache(maxsize=1000, path="matchings.sqlite")
+        >>> M = cache.rank_maximal_matching(G, top_nodes=applicants)
+        >>> M = cache.rank_maximal_matching(G.copy(), top_nodes=applicants)  # hit
+        >>> cache.cache_info()
+        CacheInfo(hits=1, misses=1, disk_hits=0, evictions=0, maxsize=1000, currsize=1)
+
+    Notes
+    -----
+    A hit hashes the edges of the graph, O(n + m) (nothing if the caller
+    passes `key`), but neither converts it nor runs the algorithm, and copies
+    the stored result, O(size of the matching). Results
+    are stored with pickle, a store must only be shared with trusted writers.
+    """
+
+    def __init__(self, maxsize=128, path=None):
+        self.maxsize = maxsize
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._disk_hits = self._evictions = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, matching BLOB)")
+            self._db.commit()
+
+    def rank_maximal_matching(self, G, rank="rank", top_nodes=None, one_sided=False, method="auto", key=None):
+        """Returns `rank_maximal_matching(G, rank, top_nodes, one_sided, method=method)`,
+        from the cache if a graph with the same ranked edges was solved before.
+
+        `key` is an optional string naming the content of G (a version number
+        of the data, for example), used in place of the hash of its edges; the
+        caller guarantees that graphs given the same key have the same ranked
+        edges and top nodes."""
+        if G.number_of_edges() == 0:
+            return {}
+        if top_nodes is not None and not isinstance(top_nodes, (set, frozenset)):
+            top_nodes = set(top_nodes)  # once, for the hash and the conversion
+        graph = graph_key(G, rank, top_nodes) if key is None else f"key:{key}"
+        key = f"{graph}:{rank}:{int(one_sided)}:{method}"
+        M = self._lookup(key)
+        if M is None:
+            cg = G if isinstance(G, CompactRankedGraph) else CompactRankedGraph.from_graph(G, rank, top_nodes)
+            mate = compact_graph.solve(cg, method=method)
+            M = dict(cg.iter_matching(mate)) if one_sided else cg.matching_dict(mate)
+            self._store(key, M)
+        return dict(M)
+
+    def cache_info(self):
+        """Returns the statistics of the cache as a CacheInfo named tuple."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._disk_hits, self._evictions, self.maxsize,
+                             len(self._results))
+
+    def cache_clear(self, disk=False):
+        """Empties the in-memory results (and the persistent store if `disk`) and resets the statistics."""
+        with self._lock:
+            self._results.clear()
+            self._hits = self._misses = self._disk_hits = self._evictions = 0
+            if disk and self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def close(self):
+        """Closes the persistent store."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _lookup(self, key):
+        with self._lock:
+            M = self._results.get(key)
+            if M is not None:
+                self._results.move_to_end(key)
+                self._hits += 1
+                return M
+            if self._db is not None:
+                row = self._db.execute("SELECT matching FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    M = pickle.loads(row[0])
+                    self._hits += 1
+                    self._disk_hits += 1
+                    self._remember(key, M)
+                    return M
+            self._misses += 1
+            return None
+
+    def _store(self, key, M):
+        with self._lock:
+            self._remember(key, M)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)",
+                                 (key, pickle.dumps(M, protocol=pickle.HIGHEST_PROTOCOL)))
+                self._db.commit()
+
+    def _remember(self, key, M):
+        self._results[key] = M
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+            self._evictions += 1
@@ -1,10 +1,20 @@
+import array
 import collections
+import concurrent.futures
 import copy
+import itertools
 import math
+import os
+import time
 
+import numpy as np
 import networkx as nx
 from networkx.algorithms.bipartite import sets as bipartite_sets
 
+import compact_graph
+from checkpoint import Checkpoint
+from compact_graph import CompactRankedGraph
+
 """
 Returns the rank maximal matching of the ranked bipartite graph `G`.
     A ranked graph is a graph in which every edge has a rank [1,r]
@@ -17,13 +27,41 @@ Returns the rank maximal matching of the ranked bipartite graph `G`.
     Parameters
     ----------
     G : NetworkX graph
-      Undirected weighted (the weight of every edge represents the rank) bipartite graph
+      Undirected weighted (the weight of every edge represents the rank) bipartite graph,
+      or a CompactRankedGraph loaded from bulk data (see the `loaders` module)
+    one_sided : bool, optional (default=False)
+      If True only the nodes of the `top_nodes` side are keys of the matching.
+      Without `top_nodes` the keys are the side `bipartite_sets` picks, the
+      side of the first node of `G` (it is connected then), which the caller
+      does not choose and which may differ between graphs; pass `top_nodes` to fix it
+    on_phase : callable, optional
+      Called after every rank phase with a dictionary of its statistics: the
+      rank, the edges it added to Gi, the augmentations and matching size,
+      the sizes of the even/odd/unreachable sets, the pruned edges and the
+      time of every step. Nothing is measured when it is None.
+        >>> stats = []
+        >>> M = rank_maximal_matching(G, on_phase=stats.append)
+    method : string, optional (default="auto")
+      The maximum matching engine that augments the matching of the previous
+      rank in every phase:
+        "hopcroft_karp" - Hopcroft-Karp phases from the free top nodes
+        "augmenting_path" - a greedy pass, then one depth first search per free node
+        "push_relabel" - double push with global relabeling
+        "auto" - chosen per phase by the numbers of free nodes of both sides
+      All give rank maximal matchings, possibly different ones.
+    checkpoint : str, path-like or Checkpoint, optional
+      Directory where the phase index, the pruned edge set and the matching
+      are saved after every phase (see the `checkpoint` module). If it already
+      holds a checkpoint of the same graph the run continues from it, see
+      `resume_rank_maximal_matching`.
     Returns
     -------
     M : dictionary
        The matching is returned as a dictionary, `matching`, such that
          ``matching[v] == w`` if node `v` is matched to node `w`. Unmatched
         nodes do not occur as a key in `matching`.
+        See `rank_signature` and `iter_rank_maximal_matching` when only the
+        number of edges of every rank or a stream of the matched pairs is needed.
     Examples
     --------
     In the bipartite graph, G = (V,E). with the sets V1 as 0 and V2 as 1,
@@ -86,68 +124,526 @@ Returns the rank maximal matching of the ranked bipartite graph `G`.
     """
 
 
-def rank_maximal_matching(G, rank="rank", top_nodes=None):
-    graph = nx.Graph(G)
-    Gi = nx.Graph()
-    Gi.add_nodes_from(G.nodes)
-    max_rank, min_rank = get_max_and_min_rank(G, rank)
-    create_Gi(graph, Gi, min_rank, rank=rank)
-    left, right = bipartite_sets(G, top_nodes)
-    M = nx.bipartite.hopcroft_karp_matching(Gi, left)
-    matching_length = len(M)
-    free_nodes = find_free_vertices(Gi, M)
-    for i in range(min_rank, max_rank):
-        even, odd, unreachable = divide_to_sets(Gi, M, free_nodes)
-        remove_edges(graph, odd, unreachable, i, rank=rank)
-        create_Gi(graph, Gi, i + 1, rank=rank)
-        M = nx.bipartite.hopcroft_karp_matching(Gi, top_nodes=left)
-        if matching_length == len(M):
-            return M
-        matching_length = len(M)
+def rank_maximal_matching(G, rank="rank", top_nodes=None, one_sided=False, on_phase=None, method="auto",
+                          checkpoint=None):
+    if G.number_of_edges() == 0:
+        return {}
+    if checkpoint is not None and not isinstance(checkpoint, Checkpoint):
+        checkpoint = Checkpoint(checkpoint)
+    cg, mate = _solve_graph(G, rank, top_nodes, on_phase, method, checkpoint)
+    if one_sided:
+        return dict(cg.iter_matching(mate))
+    return cg.matching_dict(mate)
+
+
+def resume_rank_maximal_matching(G, checkpoint, rank="rank", top_nodes=None, one_sided=False, on_phase=None):
+    """Continues the run of `rank_maximal_matching` on `G` saved in `checkpoint`
+    after its last completed phase, with the method of the run. The result is
+    the matching of an uninterrupted run.
+
+    Parameters
+    ----------
+    G, rank, top_nodes, one_sided, on_phase : as in `rank_maximal_matching`,
+      `G` and `top_nodes` must give the same graph as in the interrupted run
+    checkpoint : str, path-like or Checkpoint
+
+    Returns
+    -------
+    M : dictionary
+
+    Raises
+    ------
+    ValueError
+      If there is no checkpoint or it is of another graph
+    """
+    if not isinstance(checkpoint, Checkpoint):
+        checkpoint = Checkpoint(checkpoint)
+    state = checkpoint.state()
+    if state is None:
+        raise ValueError(f"There is no checkpoint in {checkpoint.directory}")
+    return rank_maximal_matching(G, rank, top_nodes, one_sided, on_phase, state["method"], checkpoint)
+
+
+def anytime_rank_maximal_matching(G, budget, rank="rank", top_nodes=None, one_sided=False, method="auto"):
+    """Returns a matching of `G` found within about `budget` seconds, and the
+    number of ranks for which it is as good as a rank maximal matching.
+
+    The phases run while the longest phase so far still fits in the budget,
+    after phase k the matching has the numbers of edges of the k best ranks of
+    a rank maximal matching. It is then completed greedily with the edges of
+    the worse ranks. A phase is not interrupted, so the budget is exceeded
+    when a phase takes longer than all the phases before it.
+
+    Parameters
+    ----------
+    G, rank, top_nodes, one_sided, method : as in `rank_maximal_matching`
+    budget : float
+      Seconds, from the call, including the conversion of `G`
+
+    Returns
+    -------
+    M : dictionary
+      The matching, as returned by `rank_maximal_matching`
+    optimal_ranks : int
+      k, the number of the best ranks (of the distinct ranks of `G`, in
+      increasing order) whose numbers of matched edges are optimal. If it is
+      the number of distinct ranks, M is rank maximal.
+
+    Examples
+    --------
+        >>> M, k = anytime_rank_maximal_matching(G, 0.3, top_nodes=applicants)
+        >>> sorted({rank for _, _, rank in G.edges(data="rank")})[:k]  # the ranks guaranteed optimal
+    """
+    deadline = time.perf_counter() + budget
+    if G.number_of_edges() == 0:
+        return {}, 0
+    cg = G if isinstance(G, CompactRankedGraph) else CompactRankedGraph.from_graph(G, rank, top_nodes)
+    mate, k = compact_graph.solve_within(cg, deadline, method)
+    if one_sided:
+        return dict(cg.iter_matching(mate)), k
+    return cg.matching_dict(mate), k
+
+
+def rank_signature(G, rank="rank", top_nodes=None):
+    """Returns the signature of the rank maximal matchings of `G`.
+
+    The signature is the number of matched edges of every rank, it is the same
+    for all rank maximal matchings. It is counted on the internal arrays of the
+    algorithm, without building the matching dictionary.
+
+    Parameters
+    ----------
+    G, rank, top_nodes : as in `rank_maximal_matching`
+
+    Returns
+    -------
+    signature : dictionary
+      ``signature[r]`` is the number of matched edges of rank `r`, for the
+      ranks with at least one matched edge, in increasing order of rank
+
+    Examples
+    --------
+        >>> G = nx.Graph()
+        >>> G.add_weighted_edges_from([('a1', 'p1', 2), ('a1', 'p2', 1), ('a2', 'p2', 2)])
+        >>> rank_signature(G, rank="weight", top_nodes=['a1', 'a2'])
+        {1: 1}
+    """
+    if G.number_of_edges() == 0:
+        return {}
+    cg, mate = _solve_graph(G, rank, top_nodes)
+    return cg.signature(mate)
+
+
+def iter_rank_maximal_matching(G, rank="rank", top_nodes=None):
+    """Returns a generator of the edges ``(u, v)`` of a rank maximal matching
+    of `G`, with `u` on the side of `top_nodes`. Without `top_nodes`, `u` is
+    on the side `bipartite_sets` picks (the side of the first node of `G`,
+    which is connected then), which may differ between graphs.
+
+    The pairs are produced one at a time from the internal mate array, each
+    matched edge once, instead of a dictionary holding both directions.
+
+    Parameters
+    ----------
+    G, rank, top_nodes : as in `rank_maximal_matching`
+    """
+    if G.number_of_edges() == 0:
+        return iter(())
+    cg, mate = _solve_graph(G, rank, top_nodes)
+    return cg.iter_matching(mate)
+
+
+def capacitated_rank_maximal_matching(G, capacity="capacity", rank="rank", top_nodes=None):
+    """Returns a rank maximal many-to-many matching of `G` in which every node
+    `v` is matched with at most ``G.nodes[v][capacity]`` nodes.
+
+    Equivalent to cloning every node into `capacity` copies and calling
+    `rank_maximal_matching`, but the capacities are handled inside the
+    augmentation and the even/odd/unreachable decomposition, so the time and
+    memory are those of `G`, not of the cloned graph. As with cloning, only
+    the nodes of one side (e.g. the posts) may have capacities above 1.
+
+    Parameters
+    ----------
+    G : NetworkX graph
+      Undirected bipartite graph with a `rank` attribute on every edge
+    capacity : string, optional (default="capacity")
+      Node data key holding the capacities, nodes without it have capacity 1
+    rank, top_nodes : as in `rank_maximal_matching`
+
+    Returns
+    -------
+    M : dictionary
+      ``M[v]`` is the set of the nodes matched with `v`, unmatched nodes do
+      not occur as a key
+
+    Raises
+    ------
+    NetworkXError
+      If nodes of both sides have capacities greater than 1
+      or a capacity is not a non negative integer
+
+    Examples
+    --------
+        >>> G = nx.Graph()
+        >>> G.add_node('course', seats=2)
+        >>> G.add_weighted_edges_from([('s1', 'course', 1), ('s2', 'course', 1), ('s3', 'course', 2)])
+        >>> M = capacitated_rank_maximal_matching(G, capacity="seats", rank="weight")
+        >>> sorted(M['course'])
+        ['s1', 's2']
+    """
+    if G.number_of_edges() == 0:
+        return {}
+    cg = CompactRankedGraph.from_graph(G, rank, top_nodes, capacity=capacity)
+    if (cg.capacities[cg.is_left] > 1).any() and (cg.capacities[~cg.is_left] > 1).any():
+        raise nx.NetworkXError("Capacities greater than 1 are supported on one side of the graph only")
+    matched = compact_graph.solve_capacitated(cg)
+    nodes = cg.nodes
+    M = {}
+    for u, v in zip(cg.tails[matched].tolist(), cg.heads[matched].tolist()):
+        M.setdefault(nodes[u], set()).add(nodes[v])
+        M.setdefault(nodes[v], set()).add(nodes[u])
+    return M
+
+
+def verify_rank_maximal_matching(G, M, rank="rank", top_nodes=None):
+    """Checks that `M` is a rank maximal matching of `G`, with a witness if it is not.
+
+    The matching is checked against the optimality conditions of the
+    algorithm of Irving et al., in one pass over the ranks and without
+    computing a matching: for every rank r, the matched edges of rank at most
+    r must be a maximum matching of the pruned graph G'r, which is pruned by
+    the even/odd/unreachable sets of these edges. The sets are the same for
+    every maximum matching of G'r, so any rank maximal matching passes, not
+    only the one `rank_maximal_matching` returns.
+
+    Parameters
+    ----------
+    G : NetworkX graph
+      Undirected bipartite graph with a `rank` attribute on every edge
+    M : dictionary
+      The matching, in both directions as returned by `rank_maximal_matching`
+      or with only the top nodes as keys
+    rank, top_nodes : as in `rank_maximal_matching`
+
+    Returns
+    -------
+    (ok, witness) : tuple
+      ok is True if `M` is rank maximal, witness is None then. Otherwise
+      witness is a dictionary with a "reason" and the evidence:
+        "not a matching" - "edge", a pair of `M` that is not an edge of `G`
+                           or shares a node with another pair
+        "augmenting path" - "rank" r and "path", an M-alternating path of G'r
+                            between two nodes free in the edges of `M` of rank
+                            at most r, so that more edges of rank at most r
+                            can be matched
+
+    Examples
+    --------
+        >>> G = nx.Graph()
+        >>> G.add_weighted_edges_from([('a1', 'p1', 2), ('a1', 'p2', 1), ('a2', 'p2', 2)], weight="rank")
+        >>> verify_rank_maximal_matching(G, {'a1': 'p2', 'p2': 'a1'})
+        (True, None)
+        >>> verify_rank_maximal_matching(G, {'a1': 'p1', 'a2': 'p2'}, top_nodes=['a1', 'a2'])
+        (False, {'reason': 'augmenting path', 'rank': 1, 'path': ['a1', 'p2']})
+    """
+    if G.number_of_edges() == 0:
+        return (True, None) if not M else (False, {"reason": "not a matching", "edge": next(iter(M.items()))})
+    cg = CompactRankedGraph.from_graph(G, rank, top_nodes)
+    index = cg.index
+    mate = np.full(cg.n, -1, dtype=np.int64)
+    for u, v in M.items():
+        if not G.has_edge(u, v):
+            return False, {"reason": "not a matching", "edge": (u, v)}
+        a, b = index[u], index[v]
+        if mate[a] != b and (mate[a] >= 0 or mate[b] >= 0):
+            return False, {"reason": "not a matching", "edge": (u, v)}
+        mate[a], mate[b] = b, a
+    failure = compact_graph.verify(cg, mate)
+    if failure is None:
+        return True, None
+    rank_i, path = failure
+    return False, {"reason": "augmenting path", "rank": rank_i, "path": [cg.nodes[u] for u in path]}
+
+
+def _solve_graph(G, rank, top_nodes, on_phase=None, method="auto", checkpoint=None):
+    """runs the phases on an integer relabeled, array backed copy of G (or G itself if it is one)
+    return - the compact graph and the mate array of the matching"""
+    cg = G if isinstance(G, CompactRankedGraph) else CompactRankedGraph.from_graph(G, rank, top_nodes)
+    return cg, compact_graph.solve(cg, on_phase, method=method, checkpoint=checkpoint)
+
+
+def parallel_rank_maximal_matching(G, rank="rank", top_nodes=None, n_jobs=None, chunk_size=10000):
+    """Returns the rank maximal matching of the ranked bipartite graph `G`,
+    solving its connected components in parallel.
+
+    The components are independent, so their rank maximal matchings together
+    are a rank maximal matching of `G`. Components are packed into chunks of
+    about `chunk_size` edges (so thousands of tiny components do not cost a
+    task each) and the chunks are solved in a process pool.
+
+    Parameters
+    ----------
+    G : NetworkX graph
+      Undirected bipartite graph with a `rank` attribute on every edge
+    rank : string, optional (default="rank")
+      Edge data key holding the ranks
+    top_nodes : container, optional
+      Nodes of one side. Unlike `rank_maximal_matching`, a disconnected `G`
+      does not need it, every component is colored on its own.
+    n_jobs : int, optional
+      Number of worker processes, by default ``os.cpu_count()``. With 1 (or a
+      single chunk) everything runs in the current process.
+    chunk_size : int, optional (default=10000)
+      Minimum number of edges of a chunk, components are never split
+
+    Returns
+    -------
+    M : dictionary
+      Same as `rank_maximal_matching`
+
+    Examples
+    --------
+        >>> G = nx.Graph()
+        >>> G.add_edges_from([('a1', 'p1', {'rank': 1}), ('a2', 'p2', {'rank': 2})])
+        >>> M = parallel_rank_maximal_matching(G, n_jobs=2, chunk_size=1)
+        >>> M['a1'], M['p2']
+        ('p1', 'a2')
+    """
+    chunks = list(_component_chunks(G, rank, top_nodes, chunk_size))
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    M = {}
+    if n_jobs == 1 or len(chunks) <= 1:
+        for nodes, arrays in chunks:
+            _merge_mate(M, nodes, _solve_chunk(*arrays))
+        return M
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks))) as executor:
+        futures = {executor.submit(_solve_chunk, *arrays): nodes for nodes, arrays in chunks}
+        for future in concurrent.futures.as_completed(futures):
+            _merge_mate(M, futures[future], future.result())
     return M
 
 
+def _component_chunks(G, rank, top_nodes, chunk_size):
+    """
+    Packs the connected components of G (with at least one edge) into chunks
+    return - generator of (nodes, (is_left, tails, heads, ranks)), the arrays
+             use the chunk local integer labels (positions in nodes)
+    """
+    left = None if top_nodes is None else set(top_nodes)
+    nodes, is_left = [], array.array("b")
+    tails, heads, ranks = array.array("q"), array.array("q"), []  # the ranks keep their type, as in from_graph
+    for component in nx.connected_components(G):
+        if len(component) == 1:
+            continue
+        component_left = left
+        if component_left is None:
+            component_left, _ = bipartite_sets(G.subgraph(component))
+        local = {}
+        for node in component:
+            local[node] = len(nodes)
+            nodes.append(node)
+            is_left.append(node in component_left)
+        for u, v, rank_e in G.edges(component, data=rank):
+            if rank_e is None:
+                raise nx.NetworkXError(f"Edge ({u}, {v}) has no attribute {rank!r}")
+            if v in component_left:
+                u, v = v, u
+            tails.append(local[u])
+            heads.append(local[v])
+            ranks.append(rank_e)
+        if len(ranks) >= chunk_size:
+            yield nodes, (is_left, tails, heads, np.asarray(ranks))
+            nodes, is_left = [], array.array("b")
+            tails, heads, ranks = array.array("q"), array.array("q"), []
+    if ranks:
+        yield nodes, (is_left, tails, heads, np.asarray(ranks))
+
+
+def _solve_chunk(is_left, tails, heads, ranks):
+    """worker of parallel_rank_maximal_matching, return - the mate array of the chunk"""
+    cg = CompactRankedGraph(range(len(is_left)), is_left, tails, heads, ranks)
+    return compact_graph.solve(cg)
+
+
+def _merge_mate(M, nodes, mate):
+    for u, v in enumerate(mate.tolist()):
+        if v >= 0:
+            M[nodes[u]] = nodes[v]
+
+
+def batch_rank_maximal_matching(instances, rank="rank", top_nodes=None, n_jobs=1, ordered=True, chunk_size=64):
+    """Returns a generator of the rank maximal matchings of many independent
+    instances, yielded as they are solved.
+
+    Made for streams of many small instances, where the cost of a call of
+    `rank_maximal_matching` is mostly per call overhead: the work arrays of
+    the algorithm are allocated once and reused by every instance (once per
+    worker process), and edge lists are read without a bipartite coloring.
+
+    Parameters
+    ----------
+    instances : iterable
+      Every instance is a NetworkX graph with a `rank` attribute on every edge
+      or an iterable of ``(top node, bottom node, rank)`` triples. The
+      iterable is read lazily, at most a few chunks ahead of the results.
+    rank : string, optional (default="rank")
+      Edge data key holding the ranks of the graphs
+    top_nodes : container, optional
+      Top nodes of the graphs (may hold the top nodes of all of them), needed
+      for disconnected graphs
+    n_jobs : int, optional (default=1)
+      Number of worker processes, None for ``os.cpu_count()``. With 1
+      everything runs in the current process.
+    ordered : bool, optional (default=True)
+      If True the matchings are yielded in the order of `instances`,
+      otherwise as soon as their chunk is solved
+    chunk_size : int, optional (default=64)
+      Number of instances sent to a worker process at once
+
+    Yields
+    ------
+    (i, M) : tuple
+      The position `i` of the instance in `instances` and its matching `M`,
+      as returned by `rank_maximal_matching`
+
+    Examples
+    --------
+        >>> schools = [[('a1', 'p1', 1), ('a2', 'p1', 1), ('a2', 'p2', 2)], [('b1', 'q1', 1)]]
+        >>> for i, M in batch_rank_maximal_matching(schools):
+        ...     print(i, M)
+        0 {'a1': 'p1', 'p1': 'a1', 'a2': 'p2', 'p2': 'a2'}
+        1 {'b1': 'q1', 'q1': 'b1'}
+    """
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    if top_nodes is not None and not isinstance(top_nodes, (set, frozenset)):
+        top_nodes = set(top_nodes)  # once, not for every instance
+    if n_jobs == 1:
+        workspace = compact_graph.Workspace()
+        for i, instance in enumerate(instances):
+            yield i, _solve_instance(instance, rank, top_nodes, workspace)
+        return
+    numbered = enumerate(instances)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = collections.deque()
+        try:
+            while True:
+                batch = list(itertools.islice(numbered, chunk_size))
+                if batch:
+                    pending.append(executor.submit(_solve_batch, batch, rank, top_nodes))
+                # a bounded number of chunks in flight, the instances are not all read up front
+                while pending and (not batch or len(pending) >= 2 * n_jobs):
+                    if ordered:
+                        done = [pending.popleft()]
+                    else:
+                        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            pending.remove(future)
+                    for future in done:
+                        yield from future.result()
+                if not batch:
+                    return
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+_worker_workspace = None
+
+
+def _solve_batch(batch, rank, top_nodes):
+    """worker of batch_rank_maximal_matching, return - list of (i, M)"""
+    global _worker_workspace
+    if _worker_workspace is None:
+        _worker_workspace = compact_graph.Workspace()
+    return [(i, _solve_instance(instance, rank, top_nodes, _worker_workspace)) for i, instance in batch]
+
+
+def _solve_instance(instance, rank, top_nodes, workspace):
+    """
+    instance - graph or iterable of (top node, bottom node, rank)
+    return - its rank maximal matching dictionary
+    """
+    if isinstance(instance, nx.Graph):
+        if instance.number_of_edges() == 0:
+            return {}
+        cg = CompactRankedGraph.from_graph(instance, rank, top_nodes)
+    else:
+        cg = CompactRankedGraph.from_edges(instance)
+    return cg.matching_dict(compact_graph.solve(cg, workspace=workspace))
+
+
 def get_max_and_min_rank(G, rank="rank"):
     x = set(d[rank] for (u, v, d) in G.edges(data=True))
     return max(x), min(x)
 
 
-def alternating_dfs(G, matched_edges, free_nodes):
-    """Returns True if and only if `u` is connected to one of the
-    targets by an alternating path.
-    `u` is a vertex in the graph `G`.
-    If `along_matched` is True, this step of the depth-first search
-    will continue only through edges in the given matching. Otherwise, it
-    will continue only through edges not in the given matching.
-    """
-    even = set()
-    odd = set()
-    unreachable = set(G.nodes)
+def gallai_edmonds_decomposition(G, M, free_nodes=None):
+    """Returns the even, odd and unreachable sets of the bipartite graph `G`
+    with respect to its maximum matching `M`.
+
+    A node is even (odd) if it can be reached from a free node by an
+    alternating path of even (odd) length, and unreachable otherwise. For a
+    maximum matching the three sets do not depend on which maximum matching
+    is used (Gallai-Edmonds decomposition).
+
+    Parameters
+    ----------
+    G : NetworkX graph
+      Undirected bipartite graph
+    M : dictionary
+      Matching of `G` such that ``M[v] == w`` and ``M[w] == v`` if `v` is
+      matched to `w`
+    free_nodes : iterable, optional
+      Nodes the alternating paths start from, by default all nodes of `G`
+      that are not in `M`
+
+    Returns
+    -------
+    even, odd, unreachable : sets of nodes
+
+    Notes
+    -----
+    A single multi-source BFS, the running time is O(n + m).
+    """
+    if free_nodes is None:
+        free_nodes = find_free_vertices(G, M)
+    labels = {}
+    queue = collections.deque()
     for u in free_nodes:
-        if u not in unreachable:
-            continue
-        initial_depth = 0
-        stack = [(u, iter(G[u]), initial_depth)]
-        even.add(u)
-        unreachable.remove(u)
-        while stack:
-            parent, children, depth = stack[-1]
-            try:
-                child = next(children)
-                if child in unreachable:
-                    if depth % 2 == 0 and (parent, child) not in matched_edges:
-                        odd.add(child)
-                        unreachable.remove(child)
-                        stack.append((child, iter(G[child]), depth + 1))
-                    elif depth % 2 == 1 and (parent, child) in matched_edges:
-                        even.add(child)
-                        unreachable.remove(child)
-                        stack.append((child, iter(G[child]), depth + 1))
-            except StopIteration:
-                stack.pop()
+        if u not in labels:
+            labels[u] = True
+            queue.append(u)
+    while queue:
+        parent = queue.popleft()
+        if labels[parent]:
+            mate = M.get(parent)
+            for child in G[parent]:
+                if child not in labels and child != mate:
+                    labels[child] = False
+                    queue.append(child)
+        else:
+            child = M.get(parent)
+            if child is not None and child not in labels:
+                labels[child] = True
+                queue.append(child)
+    even = {node for node, is_even in labels.items() if is_even}
+    odd = {node for node, is_even in labels.items() if not is_even}
+    unreachable = {node for node in G if node not in labels}
     return even, odd, unreachable
 
 
+def alternating_dfs(G, matched_edges, free_nodes):
+    """Returns the sets of nodes reached from `free_nodes` by even and odd
+    alternating paths, and the unreachable nodes.
+    `matched_edges` is the matching, as a dictionary or its items.
+    Kept for compatibility, see `gallai_edmonds_decomposition`.
+    """
+    return gallai_edmonds_decomposition(G, dict(matched_edges), free_nodes)
+
+
 def divide_to_sets(Gi, M, free_nodes):
     """
     Gi - is a graph with i' ranked edges
@@ -155,7 +651,7 @@ def divide_to_sets(Gi, M, free_nodes):
             Oi  -  set of odd vertices
             Ui  -  set of unreachable vertices
     """
-    return alternating_dfs(Gi, M.items(), free_nodes)
+    return gallai_edmonds_decomposition(Gi, M, free_nodes)
 
 
 def find_free_vertices(Gi: nx.Graph, M):
@@ -163,10 +659,7 @@ def find_free_vertices(Gi: nx.Graph, M):
     Gi - is a graph with i' ranked edges
     return - list_of_free_vertices
     """
-    free_nodes = list(Gi.nodes)
-    for key in M:
-        free_nodes.remove(key)
-    return free_nodes
+    return [node for node in Gi if node not in M]
 
 
 def create_Gi(G, Gi, rank_i, rank="rank"):
@@ -178,10 +671,10 @@ def remove_edges(G, Oi, Ui, rank_i, rank="rank"):
     remove edges from Oi or Ui with rank greater than rank_i
     remove OiUi edges
     remove OiOi edges
+    (in a single pass over the edges incident to Oi or Ui)
     """
-    G.remove_edges_from([(u, v) for (u, v, d) in G.edges(Oi.union(Ui), data=True) if  # remove rank> rank_i
-                         d[rank] > rank_i])
-    G.remove_edges_from([(u, v) for (u, v) in G.edges(Oi) if  # remove OU
-                         v in Ui])
-    G.remove_edges_from([(u, v) for (u, v) in G.edges(Oi) if  # remove OO
-                         v in Oi])
+    odd_or_unreachable = set(Oi).union(Ui)
+    G.remove_edges_from([(u, v) for (u, v, d) in G.edges(odd_or_unreachable, data=True) if
+                         d[rank] > rank_i or  # remove rank > rank_i
+                         (u in Oi and v in odd_or_unreachable) or  # remove OO and OU
+                         (v in Oi and u in odd_or_unreachable)])
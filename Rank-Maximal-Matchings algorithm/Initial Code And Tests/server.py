@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import itertools
+import json
+import os
+import signal
+
+import numpy as np
+
+import compact_graph
+from compact_graph import CompactRankedGraph
+
+"""
+A long lived solver service: an asyncio front end on a Unix socket or a
+localhost TCP port, and a pool of worker processes that have imported and run
+the algorithm once before the first request, so a request costs the solve and
+the transfer of its edges only.
+    The protocol is one JSON object per line in both directions. A request
+        {"id": 7, "left": ["a1", "a2"], "right": ["p1", "p1"], "ranks": [1, 2],
+         "one_sided": false, "method": "auto", "timeout": 2.5}
+    (the edges as three parallel lists, `one_sided`, `method` and `timeout`
+    optional) is answered by
+        {"id": 7, "matching": [["a1", "p1"]]}
+    with the matched (top node, bottom node) pairs, or {"id": 7, "error": ...}
+    with "timeout", "cancelled", "overloaded", "invalid timeout" or the
+    message of the failure.
+    {"op": "cancel", "id": 7} cancels a request of the same connection and
+    {"op": "stats"} returns the counters and the latency percentiles. The
+    replies of a connection come in the order the requests finish.
+    The server queues the requests and hands at most one per worker to the
+    pool, so a queued request is cancelled for real. A request already running
+    in a worker cannot be interrupted: on cancellation or timeout it is
+    answered at once and its result is dropped when the worker finishes.
+    Backpressure is explicit, a request arriving with `max_pending` requests
+    queued or running (abandoned ones included, they still hold a worker) is
+    answered "overloaded" and the client retries later.
+        python server.py --socket /tmp/rmm.sock --workers 4
+        >>> async with await SolverClient.connect(path="/tmp/rmm.sock") as client:
+        ...     M = await client.solve([("a1", "p1", 1), ("a2", "p1", 2)])
+    See load_test.py for a load generator.
+"""
+
+LATENCY_WINDOW = 10000
+MAX_MESSAGE = 64 * 2 ** 20
+
+
+def _warm_worker():
+    """pool initializer, imports and runs the algorithm once so the first request does not pay for it"""
+    compact_graph.solve(CompactRankedGraph.from_edges([("a", "p", 1), ("b", "p", 1), ("b", "q", 2)]))
+
+
+def _solve_payload(left, right, ranks, one_sided, method):
+    """
+    runs in a worker
+    return - list of the matched [top node, bottom node] pairs, both orders if not one_sided
+    """
+    if not ranks:
+        return []
+    cg = CompactRankedGraph.from_edges(zip(left, right, ranks))
+    pairs = [[u, v] for u, v in cg.iter_matching(compact_graph.solve(cg, method=method))]
+    if not one_sided:
+        pairs.extend([v, u] for u, v in pairs[:])
+    return pairs
+
+
+def _noop():
+    return None
+
+
+class SolverServer:
+    """asyncio front end of a pool of warm worker processes.
+
+    Parameters
+    ----------
+    n_workers : int, optional
+      Number of worker processes, by default the number of CPUs
+    max_pending : int, optional (default=1000)
+      Requests queued or running (including the running ones that were
+      cancelled or timed out) above which new requests are rejected
+    timeout : float, optional
+      Default deadline of a request in seconds, from its arrival
+    max_message : int, optional
+      Longest request line in bytes
+
+    Examples
+    --------
+        >>> server = SolverServer(n_workers=4)
+        >>> address = await server.start(path="/tmp/rmm.sock")
+        >>> await server.serve_forever()
+    """
+
+    def __init__(self, n_workers=None, max_pending=1000, timeout=None, max_message=MAX_MESSAGE):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_message = max_message
+        self._pool = None
+        self._server = None
+        self._slots = None
+        self._connections = {}
+        self._queued = set()  # keys of the accepted requests waiting for a worker
+        self._running = 0  # jobs in the workers, answered or not
+        self._keys = itertools.count()
+        self._counts = collections.Counter()
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """Starts the worker processes, waits until they are warm and listens on
+        the Unix socket `path`, or on `host`:`port` if `path` is None.
+        Returns the address, the path or the (host, port) pair."""
+        loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.n_workers)
+        self._pool = concurrent.futures.ProcessPoolExecutor(self.n_workers, initializer=_warm_worker)
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _noop) for _ in range(self.n_workers)))
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._serve_connection, path, limit=self.max_message)
+            return path
+        self._server = await asyncio.start_server(self._serve_connection, host, port, limit=self.max_message)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stops listening, closes the connections and shuts the pool down."""
+        if self._server is not None:
+            self._server.close()
+            for writer in self._connections:
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        """Returns a dictionary of the counters and of the latency percentiles
+        (seconds, from arrival to answer) of the last LATENCY_WINDOW completed requests."""
+        stats = dict(self._counts)
+        stats.update(queued=len(self._queued), running=self._running, workers=self.n_workers)
+        if self._latencies:
+            p50, p90, p99 = np.percentile(self._latencies, [50, 90, 99]).tolist()
+            stats["latency"] = {"p50": p50, "p90": p90, "p99": p99, "max": max(self._latencies)}
+        return stats
+
+    async def _serve_connection(self, reader, writer):
+        requests = {}
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._reply(writer, {"id": None, "error": "request too long"})
+                    break
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    op = message.get("op", "solve")
+                except (ValueError, AttributeError):
+                    await self._reply(writer, {"id": None, "error": "invalid request"})
+                    continue
+                if op == "solve":
+                    self._accept(message, requests, writer)
+                elif op == "cancel":
+                    task = requests.get(message.get("id"))
+                    if task is not None:
+                        task.cancel()
+                elif op == "stats":
+                    await self._reply(writer, {"id": message.get("id"), "stats": self.stats()})
+                else:
+                    await self._reply(writer, {"id": message.get("id"), "error": f"unknown op {op!r}"})
+        except ConnectionError:
+            pass
+        finally:
+            for task in list(requests.values()):
+                task.cancel()
+            writer.close()
+            del self._connections[writer]
+
+    def _accept(self, message, requests, writer):
+        """answers at once if the request is invalid or the server overloaded, otherwise starts its task"""
+        request_id = message.get("id")
+        timeout = message.get("timeout", self.timeout)
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))):
+            asyncio.ensure_future(self._reply(writer, {"id": request_id, "error": "invalid timeout"}))
+            return
+        if len(self._queued) + self._running >= self.max_pending:
+            self._counts["rejected"] += 1
+            asyncio.ensure_future(self._reply(writer, {"id": request_id, "error": "overloaded"}))
+            return
+        key = next(self._keys)
+        self._queued.add(key)
+        task = asyncio.ensure_future(self._answer(message, key, timeout, writer, asyncio.get_running_loop().time()))
+        requests[request_id] = task
+        task.add_done_callback(functools.partial(self._answered, request_id, key, requests, writer))
+
+    def _answered(self, request_id, key, requests, writer, task):
+        """done callback of the task of a request, the task is only cancelled here if it was before it started"""
+        requests.pop(request_id, None)
+        self._queued.discard(key)
+        if task.cancelled():
+            self._counts["cancelled"] += 1
+            if not writer.is_closing():
+                asyncio.ensure_future(self._reply(writer, {"id": request_id, "error": "cancelled"}))
+
+    async def _answer(self, message, key, timeout, writer, arrival):
+        loop = asyncio.get_running_loop()
+        reply = {"id": message.get("id")}
+        try:
+            reply["matching"] = await asyncio.wait_for(self._solve(message, key), timeout)
+            self._counts["completed"] += 1
+            self._latencies.append(loop.time() - arrival)
+        except asyncio.TimeoutError:
+            self._counts["timeouts"] += 1
+            reply["error"] = "timeout"
+        except asyncio.CancelledError:
+            self._counts["cancelled"] += 1
+            reply["error"] = "cancelled"
+        except Exception as error:
+            self._counts["failed"] += 1
+            reply["error"] = f"{type(error).__name__}: {error}"
+        if writer.is_closing():
+            return
+        try:
+            await self._reply(writer, reply)
+        except ConnectionError:
+            pass
+
+    async def _solve(self, message, key):
+        """waits for a free worker, then for the result; the worker is free again when it finishes, even if the
+        request was cancelled meanwhile"""
+        loop = asyncio.get_running_loop()
+        await self._slots.acquire()
+        self._queued.discard(key)
+        self._running += 1
+
+        def release(_):
+            self._running -= 1
+            self._slots.release()
+
+        try:
+            future = self._pool.submit(_solve_payload, message["left"], message["right"], message["ranks"],
+                                       message.get("one_sided", False), message.get("method", "auto"))
+        except BaseException:
+            release(None)
+            raise
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(release, f))
+        return await asyncio.wrap_future(future)
+
+    async def _reply(self, writer, reply):
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()
+
+
+class SolverError(Exception):
+    """The server answered a request with an error."""
+
+
+class SolverClient:
+    """asyncio client of SolverServer, any number of requests in flight on one connection.
+
+    Cancelling the task awaiting `solve` cancels the request on the server.
+    """
+
+    def __init__(self, reader, writer):
+        self._reader, self._writer = reader, writer
+        self._ids = itertools.count()
+        self._waiting = {}
+        self._listener = asyncio.ensure_future(self._listen())
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=None, max_message=MAX_MESSAGE):
+        """Connects to the Unix socket `path`, or to `host`:`port` if `path` is None."""
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=max_message)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=max_message)
+        return cls(reader, writer)
+
+    async def solve(self, edges, one_sided=False, method="auto", timeout=None):
+        """Returns the rank maximal matching dictionary of the (top node, bottom
+        node, rank) triples `edges`, labels must be JSON strings or numbers.
+        Raises SolverError if the server answers with an error."""
+        left, right, ranks = [], [], []
+        for u, v, rank_e in edges:
+            left.append(u)
+            right.append(v)
+            ranks.append(rank_e)
+        request = {"left": left, "right": right, "ranks": ranks, "one_sided": one_sided, "method": method}
+        if timeout is not None:
+            request["timeout"] = timeout
+        return dict(map(tuple, await self._request(request, "matching")))
+
+    async def stats(self):
+        """Returns the statistics of the server."""
+        return await self._request({"op": "stats"}, "stats")
+
+    async def close(self):
+        self._writer.close()
+        self._listener.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _request(self, request, key):
+        request["id"] = request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        self._writer.write(json.dumps(request).encode() + b"\n")
+        try:
+            await self._writer.drain()
+            reply = await future
+        except asyncio.CancelledError:
+            if not self._writer.is_closing():
+                self._writer.write(json.dumps({"op": "cancel", "id": request_id}).encode() + b"\n")
+            raise
+        finally:
+            self._waiting.pop(request_id, None)
+        if "error" in reply:
+            raise SolverError(reply["error"])
+        return reply[key]
+
+    async def _listen(self):
+        try:
+            while line := await self._reader.readline():
+                reply = json.loads(line)
+                future = self._waiting.get(reply.get("id"))
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("The connection to the server was closed"))
+
+
+async def _serve(args):
+    server = SolverServer(args.workers, args.max_pending, args.timeout)
+    address = await server.start(path=args.socket, port=args.port)
+    print(f"listening on {address} with {server.n_workers} workers", flush=True)
+    loop = asyncio.get_running_loop()
+    serving = asyncio.ensure_future(server.serve_forever())
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, serving.cancel)
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        print(json.dumps(server.stats()), flush=True)
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves rank_maximal_matching to local clients")
+    parser.add_argument("--socket", help="Unix socket path (default: TCP on localhost)")
+    parser.add_argument("--port", type=int, default=8765, help="localhost TCP port when --socket is not given")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=1000, help="queued and running requests before rejecting")
+    parser.add_argument("--timeout", type=float, help="default request deadline in seconds")
+    asyncio.run(_serve(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
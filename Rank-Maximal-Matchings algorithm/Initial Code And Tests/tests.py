@@ -1,6 +1,24 @@
+import asyncio
+import collections
+import json
+import random
+
+import numpy as np
 import pytest
 import networkx as nx
+import allowed_edges
+import benchmark
+import dynamic_matching
+import load_test
+import loaders
+import matching_cache
 import rank_maximal_matching as rmm
+import server
+
+
+def signature(G, M, rank="rank"):
+    counts = collections.Counter(G[u][M[u]][rank] for u in M if G.nodes[u]["bipartite"] == 0)
+    return {rank_i: counts[rank_i] for rank_i in sorted(counts)}
 
 
 class TestRankMaximalMatching:
@@ -76,6 +94,49 @@ class TestRankMaximalMatching:
         M = rmm.rank_maximal_matching(G, rank="weight")
         assert M == matching
 
+    def test_parallel_rank_maximal_matching_disconnected_graph(self):
+        G = nx.Graph()
+        G.add_weighted_edges_from([('a1', 'p1', 1), ('a1', 'p2', 1), ('a2', 'p1', 1), ('a2', 'p2', 2),
+                                   ('a3', 'p3', 2), ('a3', 'p4', 3), ('a4', 'p4', 1),
+                                   ('a5', 'p5', 1), ('a6', 'p5', 2)])
+        G.add_node('a7')
+        M = rmm.parallel_rank_maximal_matching(G, rank="weight", n_jobs=2, chunk_size=1)
+        assert all(M[M[node]] == node for node in M)
+        assert collections.Counter(G[node][M[node]]["weight"] for node in M) == {1: 8, 2: 2}
+        assert len(M) == len(rmm.parallel_rank_maximal_matching(G, rank="weight", n_jobs=1))
+
+    def test_parallel_rank_maximal_matching_fractional_ranks(self):
+        G = nx.Graph()
+        G.add_weighted_edges_from([('a1', 'p1', 1.5), ('a2', 'p1', 1.2), ('a3', 'p2', 0.5), ('a3', 'p3', 0.7),
+                                   ('a4', 'p2', 0.6)])
+        M = rmm.parallel_rank_maximal_matching(G, rank="weight", n_jobs=2, chunk_size=1)
+        assert M == rmm.rank_maximal_matching(G, rank="weight", top_nodes=['a1', 'a2', 'a3', 'a4'])
+        assert M == {'a2': 'p1', 'p1': 'a2', 'a3': 'p2', 'p2': 'a3'}
+
+    def test_batch_rank_maximal_matching(self):
+        rng = random.Random(3)
+        graphs = []
+        for k in range(30):
+            G = nx.Graph()
+            G.add_nodes_from([f'a{i}' for i in range(6)], bipartite=0)
+            G.add_nodes_from([f'p{i}' for i in range(4)], bipartite=1)
+            G.add_edges_from((f'a{rng.randrange(6)}', f'p{rng.randrange(4)}', {'rank': rng.randint(1, 3)})
+                             for _ in range(rng.randrange(12)))
+            graphs.append(G)
+        top_nodes = [f'a{i}' for i in range(6)]
+        expected = [signature(G, rmm.rank_maximal_matching(G, top_nodes=top_nodes)) if G.number_of_edges() else {}
+                    for G in graphs]
+        edge_lists = [[(u, v, rank) if u in top_nodes else (v, u, rank) for u, v, rank in G.edges(data="rank")]
+                      for G in graphs]
+        for instances in [graphs, edge_lists]:
+            for n_jobs, ordered in [(1, True), (2, True), (2, False)]:
+                results = list(rmm.batch_rank_maximal_matching(instances, top_nodes=top_nodes, n_jobs=n_jobs,
+                                                               ordered=ordered, chunk_size=4))
+                if ordered:
+                    assert [i for i, _ in results] == list(range(len(graphs)))
+                assert sorted(i for i, _ in results) == list(range(len(graphs)))
+                assert all(signature(graphs[i], M) == expected[i] for i, M in results)
+
     def test_rank_maximal_matching_perfect_matching(self):
         matching = {'a1': 'p2', 'a3': 'p1', 'a2': 'p3', 'p2': 'a1', 'p1': 'a3', 'p3': 'a2'}
         G = nx.Graph()
@@ -95,6 +156,142 @@ class TestRankMaximalMatching:
         M = rmm.rank_maximal_matching(G, rank="weight")
         assert M == matching
 
+    def test_rank_maximal_matching_rank_without_new_matched_edges(self):
+        # no rank 2 edge can be matched, but the rank 3 edge still can
+        matching = {'a1': 'p1', 'a2': 'p2', 'p1': 'a1', 'p2': 'a2'}
+        G = nx.Graph()
+        G.add_nodes_from(['a1', 'a2'], bipartite=0)
+        G.add_nodes_from(['p1', 'p2'], bipartite=1)
+        G.add_weighted_edges_from([('a1', 'p1', 1), ('a2', 'p1', 2), ('a2', 'p2', 3)])
+        M = rmm.rank_maximal_matching(G, rank="weight")
+        assert M == matching
+
+    def test_rank_maximal_matching_sparse_ranks(self):
+        matching = {'a1': 'p2', 'a3': 'p1', 'p2': 'a1', 'p1': 'a3'}
+        G = nx.Graph()
+        G.add_nodes_from(['a1', 'a2', 'a3'], bipartite=0)
+        G.add_nodes_from(['p1', 'p2', 'p3'], bipartite=1)
+        G.add_weighted_edges_from([('a1', 'p2', 1), ('a1', 'p3', 300), ('a2', 'p2', 1000), ('a3', 'p1', 20),
+                                   ('a3', 'p2', 300)])
+        M = rmm.rank_maximal_matching(G, rank="weight")
+        assert M == matching
+
+    def test_rank_maximal_matching_fractional_ranks(self):
+        G = nx.Graph()
+        G.add_nodes_from(['a', 'b'], bipartite=0)
+        G.add_nodes_from(['p'], bipartite=1)
+        G.add_weighted_edges_from([('a', 'p', 1.5), ('b', 'p', 1.2)])
+        assert rmm.rank_maximal_matching(G, rank="weight") == {'b': 'p', 'p': 'b'}
+        assert rmm.rank_signature(G, rank="weight") == {1.2: 1}
+        matcher = dynamic_matching.RankMaximalMatcher(G, rank="weight")
+        assert matcher.matching == {'b': 'p', 'p': 'b'}
+        matcher.change_rank('a', 'p', 1.1)
+        assert matcher.signature == {1.1: 1}
+
+    def test_rank_maximal_matching_one_sided(self):
+        G = nx.Graph()
+        G.add_nodes_from(['a1', 'a2', 'a3'], bipartite=0)
+        G.add_nodes_from(['p1', 'p2'], bipartite=1)
+        G.add_weighted_edges_from([('a1', 'p1', 1), ('a1', 'p2', 2), ('a2', 'p2', 1), ('a3', 'p2', 1)])
+        M = rmm.rank_maximal_matching(G, rank="weight", top_nodes=['p1', 'p2'], one_sided=True)
+        assert M['p1'] == 'a1' and M['p2'] in ('a2', 'a3') and len(M) == 2
+
+    def test_rank_maximal_matching_on_phase(self):
+        G = nx.Graph()
+        G.add_nodes_from(['a1', 'a2', 'a3'], bipartite=0)
+        G.add_nodes_from(['p1', 'p2', 'p3'], bipartite=1)
+        G.add_weighted_edges_from([('a1', 'p2', 1), ('a1', 'p3', 3), ('a2', 'p2', 4), ('a3', 'p1', 2), ('a3', 'p2', 3)])
+        stats = []
+        M = rmm.rank_maximal_matching(G, rank="weight", on_phase=stats.append)
+        assert M == rmm.rank_maximal_matching(G, rank="weight")
+        assert [phase["rank"] for phase in stats] == [1, 2, 3, 4]
+        assert [phase["edges_added"] for phase in stats] == [1, 1, 2, 1]
+        assert [phase["matching_size"] for phase in stats] == [1, 2, 2, 2]
+        assert [phase["augmentations"] for phase in stats] == [1, 1, 0, 0]
+        assert (stats[0]["even"], stats[0]["odd"], stats[0]["unreachable"]) == (4, 0, 2)
+        assert stats[0]["pruned"] == 3  # (a1, p3), (a2, p2) and (a3, p2) touch the unreachable a1, p2
+        assert stats[-1]["pruned"] is None and stats[-1]["augment_time"] >= 0
+
+    def test_rank_maximal_matching_methods(self):
+        rng = random.Random(5)
+        for k in range(40):
+            G = nx.Graph()
+            G.add_nodes_from([f'a{i}' for i in range(rng.randint(1, 9))], bipartite=0)
+            G.add_nodes_from([f'p{i}' for i in range(rng.randint(1, 9))], bipartite=1)
+            G.add_edges_from((f'a{rng.randrange(len(G) // 2)}', f'p{rng.randrange(3)}', {'rank': rng.randint(1, 4)})
+                             for _ in range(rng.randrange(1, 20)))
+            G.remove_nodes_from([node for node in list(G) if 'bipartite' not in G.nodes[node]])
+            top_nodes = [node for node in G if node[0] == 'a']
+            signatures = [signature(G, rmm.rank_maximal_matching(G, top_nodes=top_nodes, method=method))
+                          for method in ["hopcroft_karp", "augmenting_path", "push_relabel", "auto"]]
+            assert all(sig == signatures[0] for sig in signatures)
+        stats = []
+        rmm.rank_maximal_matching(G, top_nodes=top_nodes, method="push_relabel", on_phase=stats.append)
+        assert all(phase["method"] == "push_relabel" for phase in stats)
+        with pytest.raises(ValueError):
+            rmm.rank_maximal_matching(G, top_nodes=top_nodes, method="simplex")
+
+    def test_verify_rank_maximal_matching(self):
+        G = nx.Graph()
+        G.add_nodes_from(['a1', 'a2', 'a3'], bipartite=0)
+        G.add_nodes_from(['p1', 'p2', 'p3'], bipartite=1)
+        G.add_weighted_edges_from([('a1', 'p1', 1), ('a1', 'p2', 1), ('a2', 'p1', 2), ('a2', 'p2', 1),
+                                   ('a2', 'p3', 2), ('a3', 'p2', 2), ('a3', 'p1', 1)], weight="rank")
+        M = rmm.rank_maximal_matching(G)
+        assert rmm.verify_rank_maximal_matching(G, M) == (True, None)
+        # another rank maximal matching, one sided
+        assert rmm.verify_rank_maximal_matching(G, {'a1': 'p2', 'a2': 'p3', 'a3': 'p1'}) == (True, None)
+        ok, witness = rmm.verify_rank_maximal_matching(G, {'a1': 'p1', 'a2': 'p3', 'a3': 'p2'})
+        assert not ok and witness["reason"] == "augmenting path" and witness["rank"] == 1
+        assert witness["path"] == ['a2', 'p2']
+        ok, witness = rmm.verify_rank_maximal_matching(G, {'a1': 'p1', 'a2': 'p2', 'p3': 'a3'})
+        assert not ok and witness == {"reason": "not a matching", "edge": ('p3', 'a3')}
+        ok, witness = rmm.verify_rank_maximal_matching(G, {'a1': 'p2', 'a2': 'p1', 'a3': 'p2'})
+        assert not ok and witness == {"reason": "not a matching", "edge": ('a3', 'p2')}
+        # a maximum matching of G with one rank 1 edge less than possible
+        G.add_edge('a3', 'p4', rank=3)
+        ok, witness = rmm.verify_rank_maximal_matching(G, {'a1': 'p2', 'a2': 'p1', 'a3': 'p4'})
+        assert not ok and witness["rank"] == 1
+
+    def test_rank_maximal_matching_checkpoint(self, tmp_path):
+        G = benchmark.ranked_bipartite_graph(60, 40, list_length=6, n_ranks=6, seed=3)
+        top_nodes = [node for node in G if node[0] == "a"]
+        expected = rmm.rank_maximal_matching(G, top_nodes=top_nodes, method="augmenting_path")
+
+        def interrupt(stats):
+            if stats["rank"] == 3:
+                raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            rmm.rank_maximal_matching(G, top_nodes=top_nodes, method="augmenting_path", on_phase=interrupt,
+                                      checkpoint=tmp_path)
+        state = json.loads((tmp_path / "state.json").read_text())
+        assert state["phase"] == 3 and state["method"] == "augmenting_path"
+        assert np.load(tmp_path / state["alive"], mmap_mode="r").shape == (G.number_of_edges(),)
+        stats = []
+        assert rmm.resume_rank_maximal_matching(G, tmp_path, top_nodes=top_nodes, on_phase=stats.append) == expected
+        assert [phase["rank"] for phase in stats] == [4, 5, 6]
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["alive-6.npy", "mate-6.npy", "state.json"]
+        G.remove_edge(*next(iter(G.edges)))
+        with pytest.raises(ValueError):
+            rmm.resume_rank_maximal_matching(G, tmp_path, top_nodes=top_nodes)
+        with pytest.raises(ValueError):
+            rmm.resume_rank_maximal_matching(G, tmp_path / "empty", top_nodes=top_nodes)
+
+    def test_anytime_rank_maximal_matching(self):
+        G = nx.Graph()
+        G.add_nodes_from(['a1', 'a2'], bipartite=0)
+        G.add_nodes_from(['p1', 'p2'], bipartite=1)
+        G.add_weighted_edges_from([('a1', 'p1', 1), ('a1', 'p2', 2), ('a2', 'p1', 2)], weight="rank")
+        assert rmm.anytime_rank_maximal_matching(G, 60) == (rmm.rank_maximal_matching(G), 2)
+        # no phase fits, the greedy matching takes the rank 1 edge first
+        assert rmm.anytime_rank_maximal_matching(G, 0) == ({'a1': 'p1', 'p1': 'a1'}, 0)
+        G = benchmark.ranked_bipartite_graph(200, 100, list_length=5, n_ranks=5, seed=1)
+        top_nodes = [node for node in G if node[0] == "a"]
+        M, k = rmm.anytime_rank_maximal_matching(G, 0, top_nodes=top_nodes, one_sided=True)
+        covered = set(M) | set(M.values())
+        assert k == 0 and all(u in covered or v in covered for u, v in G.edges)
+
     def test_rank_maximal_matching_raises_ambiguous_solution(self):
         G = nx.Graph()
         G.add_nodes_from(['a1', 'a2', 'a3'])
@@ -137,7 +334,279 @@ class TestRankMaximalMatching:
         assert M == matching
 
 
+    def test_capacitated_rank_maximal_matching(self):
+        G = nx.Graph()
+        G.add_nodes_from(['s1', 's2', 's3', 's4'], bipartite=0)
+        G.add_node('c1', bipartite=1, seats=2)
+        G.add_node('c2', bipartite=1, seats=1)
+        G.add_weighted_edges_from([('s1', 'c1', 1), ('s2', 'c1', 1), ('s3', 'c1', 1), ('s3', 'c2', 2),
+                                   ('s4', 'c2', 1), ('s4', 'c1', 2)])
+        M = rmm.capacitated_rank_maximal_matching(G, capacity="seats", rank="weight")
+        assert len(M['c1']) == 2 and M['c2'] == {'s4'} and 's4' not in M['c1']
+        # the same signature as cloning every seat
+        C = nx.Graph()
+        C.add_weighted_edges_from([(s, (c, seat), w) for s, c, w in G.edges(['s1', 's2', 's3', 's4'], data="weight")
+                                   for seat in range(G.nodes[c]['seats'])])
+        MC = rmm.rank_maximal_matching(C, rank="weight", top_nodes=['s1', 's2', 's3', 's4'])
+        assert collections.Counter(G[s][c]["weight"] for s in ['s1', 's2', 's3', 's4'] for c in M.get(s, ())) == \
+            collections.Counter(C[s][MC[s]]["weight"] for s in ['s1', 's2', 's3', 's4'] if s in MC)
+        G.nodes['s1']['seats'] = 2
+        with pytest.raises(nx.NetworkXError):
+            rmm.capacitated_rank_maximal_matching(G, capacity="seats", rank="weight")
+        G.nodes['s1']['seats'] = 1
+        for seats in (2.5, "2", -1):
+            G.nodes['c1']['seats'] = seats
+            with pytest.raises(nx.NetworkXError, match="c1"):
+                rmm.capacitated_rank_maximal_matching(G, capacity="seats", rank="weight")
+
+
+class TestRankMaximalMatcher:
+
+    def test_rank_maximal_matcher_updates(self):
+        matcher = dynamic_matching.RankMaximalMatcher()
+        matcher.add_edge('a1', 'p1', 1)
+        matcher.add_edge('a2', 'p1', 2)
+        matcher.add_edge('a2', 'p2', 3)
+        assert matcher.matching == {'a1': 'p1', 'p1': 'a1', 'a2': 'p2', 'p2': 'a2'}
+        matcher.change_rank('a2', 'p1', 1)
+        assert matcher.signature == {1: 1, 3: 1}
+        matcher.remove_edge('a2', 'p2')
+        assert matcher.signature == {1: 1}
+        matcher.remove_node('a1')
+        assert matcher.matching == {'a2': 'p1', 'p1': 'a2'}
+        matcher.add_node('a1')
+        assert matcher.matching == {'a2': 'p1', 'p1': 'a2'}
+        with pytest.raises(nx.NetworkXError):
+            matcher.add_edge('a1', 'a2', 1)
+        # a rejected edge adds none of its nodes
+        with pytest.raises(nx.NetworkXError):
+            matcher.add_edge('p1', 'x', 1)
+        with pytest.raises(nx.NetworkXError):
+            matcher.remove_node('x')
+
+    def test_rank_maximal_matcher_random_updates(self):
+        rnd = random.Random(42)
+        G = nx.Graph()
+        matcher = dynamic_matching.RankMaximalMatcher()
+        for step in range(300):
+            a, p, rank = ('a', rnd.randint(0, 7)), ('p', rnd.randint(0, 7)), rnd.randint(1, 5)
+            operation = rnd.random()
+            if operation < 0.5:
+                G.add_node(a, bipartite=0)
+                G.add_node(p, bipartite=1)
+                G.add_edge(a, p, rank=rank)
+                matcher.add_edge(a, p, rank)
+            elif operation < 0.7 and G.has_edge(a, p):
+                G.remove_edge(a, p)
+                matcher.remove_edge(a, p)
+            elif operation < 0.9 and G.has_edge(a, p):
+                G[a][p]['rank'] = rank
+                matcher.change_rank(a, p, rank)
+            elif a in G:
+                G.remove_node(a)
+                matcher.remove_node(a)
+            top_nodes = [node for node in G if G.nodes[node]['bipartite'] == 0]
+            M = rmm.rank_maximal_matching(G, top_nodes=top_nodes)
+            assert signature(G, matcher.matching) == signature(G, M) == matcher.signature
+
+
+class TestBenchmarkGenerators:
+
+    def test_ranked_bipartite_graph(self):
+        G = benchmark.ranked_bipartite_graph(200, 50, list_length=4, n_ranks=4, ties=False, zipf_exponent=1.2, seed=3)
+        H = benchmark.ranked_bipartite_graph(200, 50, list_length=4, n_ranks=4, ties=False, zipf_exponent=1.2, seed=3)
+        assert sorted(G.edges(data="rank")) == sorted(H.edges(data="rank"))
+        for i in range(200):
+            ranks = sorted(rank for _, _, rank in G.edges(('a', i), data="rank"))
+            assert ranks == list(range(1, len(ranks) + 1))
+        G = benchmark.ranked_bipartite_graph(200, 50, list_length=6, n_ranks=2, ties=True, seed=3)
+        assert max(G.degree(('a', i)) for i in range(200)) <= 6
+        assert {rank for _, _, rank in G.edges(data="rank")} == {1, 2}
+
+    def test_workload_graph_sizes(self):
+        for name in benchmark.WORKLOADS:
+            for n_edges in (1000, 10000):
+                assert abs(benchmark.workload_graph(name, n_edges).number_of_edges() - n_edges) < 0.1 * n_edges
+
+    def test_run_case(self):
+        result = benchmark.run_case("uniform_sparse", 300)
+        assert result["matching_size"] == sum(result["signature"].values())
+        assert [phase["rank"] for phase in result["phases"]] == [1, 2, 3]
+        assert sum(phase["edges_added"] for phase in result["phases"]) == result["edges"]
+
+
+class TestLoaders:
+
+    def test_loaders(self, tmp_path):
+        edges = np.array([[1, 10, 1], [1, 11, 2], [2, 11, 1], [3, 11, 1], [3, 12, 3]])
+        G = nx.Graph()
+        G.add_edges_from((('a', u), ('p', v), {'rank': r}) for u, v, r in edges.tolist())
+        expected = rmm.rank_signature(G, top_nodes=[('a', u) for u in edges[:, 0].tolist()])
+        assert expected == {1: 2, 3: 1}
+        np.save(tmp_path / "edges.npy", edges)
+        edges.astype("<i8").tofile(tmp_path / "edges.bin")
+        with open(tmp_path / "edges.csv", "w") as f:
+            f.write("applicant,post,rank\n" + "".join(f"a{u},p{v},{r}\n" for u, v, r in edges.tolist()))
+        graphs = [loaders.from_edge_arrays(edges[:, 0], edges[:, 1], edges[:, 2], chunk_size=2),
+                  loaders.read_edge_file(tmp_path / "edges.npy", chunk_size=2),
+                  loaders.read_edge_file(tmp_path / "edges.bin"),
+                  loaders.read_edge_file(tmp_path / "edges.csv", header=True, chunk_size=2)]
+        for cg in graphs:
+            assert rmm.rank_signature(cg) == expected
+        M = rmm.rank_maximal_matching(graphs[0], one_sided=True)
+        assert M[3] == 12 and {M[1], M[2]} == {10, 11}
+        assert dict(rmm.iter_rank_maximal_matching(graphs[-1]))['a3'] == 'p12'
+        # the same numbers on both sides: only the one sided matching exists
+        cg = loaders.from_edge_arrays(np.array([1, 2]), np.array([2, 1]), np.array([1, 1]))
+        assert rmm.rank_maximal_matching(cg, one_sided=True) == {1: 2, 2: 1}
+        with pytest.raises(nx.NetworkXError):
+            rmm.rank_maximal_matching(cg)
+        # a repeated pair is one edge, of its best rank
+        duplicates = np.array([[1, 10, 3], [1, 10, 1], [2, 10, 2], [1, 10, 2]])
+        np.save(tmp_path / "duplicates.npy", duplicates)
+        with open(tmp_path / "duplicates.csv", "w") as f:
+            f.write("".join(f"a{u},p{v},{r}\n" for u, v, r in duplicates.tolist()))
+        for cg in [loaders.from_edge_arrays(duplicates[:, 0], duplicates[:, 1], duplicates[:, 2]),
+                   loaders.read_edge_file(tmp_path / "duplicates.npy"),
+                   loaders.read_edge_file(tmp_path / "duplicates.csv"),
+                   rmm.CompactRankedGraph.from_edges(duplicates.tolist())]:
+            assert cg.m == 2 and rmm.rank_signature(cg) == {1: 1}
+
+    def test_from_biadjacency_matrix(self):
+        scipy_sparse = pytest.importorskip("scipy.sparse")
+        A = scipy_sparse.coo_matrix(np.array([[1, 2, 0], [0, 1, 0], [0, 1, 3]]))
+        M = rmm.rank_maximal_matching(loaders.from_biadjacency_matrix(A))
+        assert M == {('row', 0): ('column', 0), ('row', 1): ('column', 1), ('row', 2): ('column', 2),
+                     ('column', 0): ('row', 0), ('column', 1): ('row', 1), ('column', 2): ('row', 2)}
+        M = rmm.rank_maximal_matching(loaders.from_biadjacency_matrix(A, ['a', 'b', 'c'], ['p', 'q', 'r']),
+                                      one_sided=True)
+        assert M == {'a': 'p', 'b': 'q', 'c': 'r'}
+        A = scipy_sparse.coo_matrix(([3, 1, 2], ([0, 0, 1], [0, 0, 0])), shape=(2, 1))  # (0, 0) stored twice
+        assert rmm.rank_signature(loaders.from_biadjacency_matrix(A)) == {1: 1}
+
+
+class TestMatchingCache:
+
+    def test_matching_cache(self, tmp_path):
+        edges = [('a1', 'p1', 1), ('a1', 'p2', 2), ('a2', 'p1', 1), ('a3', 'p2', 1), ('a3', 'p3', 3)]
+        G, H = nx.Graph(), nx.Graph()
+        G.add_weighted_edges_from(edges, weight="rank")
+        H.add_weighted_edges_from(reversed(edges), weight="rank")
+        top_nodes = ['a1', 'a2', 'a3']
+        cache = matching_cache.RankMaximalMatchingCache(maxsize=1, path=str(tmp_path / "cache.sqlite"))
+        M = cache.rank_maximal_matching(G, top_nodes=top_nodes)
+        assert M == rmm.rank_maximal_matching(G, top_nodes=top_nodes)
+        M['a1'] = 'changed'
+        assert cache.rank_maximal_matching(H, top_nodes=top_nodes) == rmm.rank_maximal_matching(G, top_nodes=top_nodes)
+        assert cache.cache_info()[:4] == (1, 1, 0, 0)
+        H['a3']['p3']['rank'] = 2
+        cache.rank_maximal_matching(H, top_nodes=top_nodes)
+        cache.rank_maximal_matching(G, top_nodes=top_nodes, one_sided=True)
+        assert cache.cache_info() == (1, 3, 0, 2, 1, 1)
+        cache.close()
+        cache = matching_cache.RankMaximalMatchingCache(path=str(tmp_path / "cache.sqlite"))
+        assert cache.rank_maximal_matching(G, top_nodes=top_nodes) == rmm.rank_maximal_matching(G, top_nodes=top_nodes)
+        assert cache.cache_info().disk_hits == 1
+        cg = rmm.CompactRankedGraph.from_graph(G, top_nodes=top_nodes)
+        assert matching_cache.graph_key(G, top_nodes=top_nodes) == matching_cache.graph_key(cg)
+        # a key of the caller replaces the hash, even for a graph that changed since
+        M = cache.rank_maximal_matching(G, top_nodes=top_nodes, key="v1")
+        assert cache.rank_maximal_matching(H, top_nodes=top_nodes, key="v1") == M
+        assert cache.cache_info()[:2] == (2, 1)
+
+
+class TestAllowedEdges:
+
+    def test_allowed_edges(self):
+        G = nx.Graph()
+        G.add_weighted_edges_from([('a1', 'p1', 1), ('a2', 'p1', 1), ('a2', 'p2', 2), ('a3', 'p2', 2), ('a4', 'p1', 2)],
+                                  weight="rank")
+        top_nodes = ['a1', 'a2', 'a3', 'a4']
+        expected = [{('a1', 'p1'), ('a2', 'p2')}, {('a1', 'p1'), ('a3', 'p2')}, {('a2', 'p1'), ('a3', 'p2')}]
+        assert allowed_edges.allowed_edges(G, top_nodes=top_nodes) == set.union(*expected)
+        H = allowed_edges.reduced_graph(G, top_nodes=top_nodes)
+        assert not H.has_edge('a4', 'p1')
+        assert [node for node, critical in H.nodes(data="critical") if critical] == ['p1', 'p2']
+        matchings = [{(u, v) for u, v in M.items() if u in top_nodes}
+                     for M in allowed_edges.enumerate_rank_maximal_matchings(G, top_nodes=top_nodes)]
+        assert sorted(map(sorted, matchings)) == sorted(map(sorted, expected))
+        for seed in range(5):
+            M = allowed_edges.random_rank_maximal_matching(G, top_nodes=top_nodes, steps=10, seed=seed)
+            assert {(u, v) for u, v in M.items() if u in top_nodes} in expected
+
+
+class TestServer:
+
+    def test_server(self):
+        edges = [('a1', 'p1', 1), ('a1', 'p2', 2), ('a2', 'p1', 1), ('a3', 'p2', 1), ('a3', 'p3', 3)]
+        G = nx.Graph()
+        G.add_weighted_edges_from(edges, weight="rank")
+        expected = rmm.rank_maximal_matching(G, top_nodes=['a1', 'a2', 'a3'])
+
+        async def scenario():
+            solver = server.SolverServer(n_workers=1, max_pending=10)
+            host, port = await solver.start(port=0)
+            serving = asyncio.ensure_future(solver.serve_forever())
+            try:
+                async with await server.SolverClient.connect(host=host, port=port) as client:
+                    results = await asyncio.gather(*(client.solve(edges) for _ in range(4)))
+                    assert all(M == expected for M in results)
+                    assert await client.solve(edges, one_sided=True) == {u: v for u, v in expected.items() if u[0] == 'a'}
+                    with pytest.raises(server.SolverError, match="timeout"):
+                        await client.solve(edges, timeout=0)
+                    with pytest.raises(server.SolverError, match="NetworkXError"):
+                        await client.solve([('a1', 'p1', 1), ('p1', 'a2', 1)])
+                    with pytest.raises(server.SolverError, match="invalid timeout"):
+                        await client.solve(edges, timeout="1")
+                    stats = await client.stats()
+                    assert stats["completed"] == 5 and stats["timeouts"] == 1 and stats["failed"] == 1
+                    assert stats["latency"]["p50"] <= stats["latency"]["max"]
+            finally:
+                serving.cancel()
+                await solver.close()
+
+        asyncio.run(scenario())
 
+    def test_server_cancel_and_overload(self):
+        edges = [('a1', 'p1', 1), ('a2', 'p1', 1), ('a2', 'p2', 2)]
+        slow_edges = load_test.instances(1, 30000)[0]  # a fraction of a second in the worker
 
+        async def stats_when(client, condition):
+            for _ in range(500):
+                stats = await client.stats()
+                if condition(stats):
+                    return stats
+                await asyncio.sleep(0.01)
+            raise AssertionError(stats)
 
+        async def scenario():
+            solver = server.SolverServer(n_workers=1, max_pending=2)
+            host, port = await solver.start(port=0)
+            serving = asyncio.ensure_future(solver.serve_forever())
+            try:
+                async with await server.SolverClient.connect(host=host, port=port) as client:
+                    slow = asyncio.ensure_future(client.solve(slow_edges))
+                    queued = asyncio.ensure_future(client.solve(edges))
+                    await stats_when(client, lambda stats: stats["running"] == 1 and stats["queued"] == 1)
+                    with pytest.raises(server.SolverError, match="overloaded"):
+                        await client.solve(edges)
+                    queued.cancel()
+                    slow.cancel()
+                    for task in (queued, slow):
+                        with pytest.raises(asyncio.CancelledError):
+                            await task
+                    stats = await stats_when(client, lambda stats: stats.get("cancelled") == 2)
+                    # the abandoned slow request still holds the worker, and counts against max_pending
+                    assert stats["queued"] == 0 and stats["running"] == 1
+                    waiting = asyncio.ensure_future(client.solve(edges))
+                    await stats_when(client, lambda stats: stats["queued"] == 1)
+                    with pytest.raises(server.SolverError, match="overloaded"):
+                        await client.solve(edges)
+                    assert await waiting == {'a1': 'p1', 'p1': 'a1', 'a2': 'p2', 'p2': 'a2'}
+                    stats = await client.stats()
+                    assert stats["queued"] == stats["running"] == 0 and stats["rejected"] == 2
+            finally:
+                serving.cancel()
+                await solver.close()
 
+        asyncio.run(scenario())
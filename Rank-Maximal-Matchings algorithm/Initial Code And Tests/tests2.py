@@ -3,6 +3,8 @@ import unittest
 from itertools import count
 
 import networkx as nx
+import numpy as np
+import compact_graph
 import rank_maximal_matching as rmm
 import copy
 
@@ -112,6 +114,18 @@ class MyTestCase(unittest.TestCase):
         print(M)"""
 
 
+    def test_rank_signature(self):
+        for graph, top_nodes, signature in [(G1, ["a1", "a2"], {1: 1}), (G2, ["a1", "a2", "a3"], {1: 2}),
+                                            (G3, ["a1", "a2", "a3"], {2: 2}),
+                                            (G4, ["a1", "a2", "a3", "a4", "a5"], {1: 4, 2: 1})]:
+            G = graph()
+            self.assertEqual(signature, rmm.rank_signature(G, rank="weight", top_nodes=top_nodes))
+            pairs = list(rmm.iter_rank_maximal_matching(G, rank="weight", top_nodes=top_nodes))
+            self.assertTrue(all(a in top_nodes for a, p in pairs))
+            self.assertEqual(signature, dict(collections.Counter(G[a][p]["weight"] for a, p in pairs)))
+        self.assertEqual({}, rmm.rank_signature(nx.Graph()))
+        self.assertEqual([], list(rmm.iter_rank_maximal_matching(nx.Graph())))
+
     def test_max_aum_path(self):
         G = G1()  # nx.Graph
         M = {"a1": "p2", "p2": "a1"}
@@ -119,6 +133,34 @@ class MyTestCase(unittest.TestCase):
         G = G2()
         M = {"a1": "p1", "p1": "a1"}
 
+    def test_compact_ranked_graph(self):
+        G = G4()
+        cg = compact_graph.CompactRankedGraph.from_graph(G, rank="weight", top_nodes=["a1", "a2", "a3", "a4", "a5"])
+        self.assertEqual((11, 13), (cg.n, cg.m))
+        self.assertEqual([1, 2, 3, 4], cg.rank_values.tolist())
+        self.assertEqual([0, 5, 9, 12, 13], cg.rank_starts.tolist())
+        self.assertTrue(cg.is_left[cg.tails].all() and not cg.is_left[cg.heads].any())
+        for u, node in enumerate(cg.nodes):
+            edges = cg.adjacent_edges[cg.indptr[u]:cg.indptr[u + 1]]
+            self.assertEqual(sorted(cg.ranks[edges].tolist()), cg.ranks[edges].tolist())
+            self.assertEqual(set(G[node]), {cg.nodes[v] for v in (cg.tails[edges] + cg.heads[edges] - u).tolist()})
+        mate = compact_graph.solve(cg)
+        self.assertEqual({"a1": "p1", "p1": "a1"}, {k: v for k, v in cg.matching_dict(mate).items() if "a1" in (k, v)})
+
+    def test_compact_graph_workspace(self):
+        G = G4()
+        top_nodes = ["a1", "a2", "a3", "a4", "a5"]
+        edges = [(u, v, d) if u in top_nodes else (v, u, d) for u, v, d in G.edges(data="weight")]
+        big = compact_graph.CompactRankedGraph.from_edges(edges)
+        small = compact_graph.CompactRankedGraph.from_edges(edges[:3])
+        self.assertEqual((11, 13), (big.n, big.m))
+        workspace = compact_graph.Workspace()
+        for cg in [big, small, big]:
+            self.assertEqual(cg.matching_dict(compact_graph.solve(cg)),
+                             cg.matching_dict(compact_graph.solve(cg, workspace=workspace)))
+        with self.assertRaises(nx.NetworkXError):
+            compact_graph.CompactRankedGraph.from_edges([("a1", "p1", 1), ("p1", "a2", 1)])
+
     def test_divide_to_set(self):
         G = G1()
         matched_edges = {"a1": "p2", "p2": "a1"}
@@ -146,6 +188,19 @@ class MyTestCase(unittest.TestCase):
                          ({'p3', 'a1', 'a2', 'a3'}, {'p1', 'p2'}, set())),
         ({'a3', 'a1', 'a2', 'p3'}, {'p2', 'p1'}, set())
 
+    def test_gallai_edmonds_decomposition(self):
+        G = article_graph()
+        G.remove_edges_from([(u, v, d) for (u, v, d) in G.edges(data=True) if d["weight"] > 1])
+        M = {"a1": "p1", "p1": "a1", "a2": "p2", "p2": "a2"}
+        self.assertEqual(({'p3', 'a1', 'a2', 'a3'}, {'p1', 'p2'}, set()), rmm.gallai_edmonds_decomposition(G, M))
+        # the partition is the same for every maximum matching
+        M = {"a3": "p1", "p1": "a3", "a1": "p2", "p2": "a1"}
+        self.assertEqual(({'p3', 'a1', 'a2', 'a3'}, {'p1', 'p2'}, set()), rmm.gallai_edmonds_decomposition(G, M))
+        G = G4()
+        M = nx.bipartite.maximum_matching(G, top_nodes=["a1", "a2", "a3", "a4", "a5"])
+        self.assertEqual(({'p1', 'p2', 'p3', 'p5', 'p6'}, {'a1', 'a2', 'a3', 'a5'}, {'a4', 'p4'}),
+                         rmm.gallai_edmonds_decomposition(G, M))
+
     def test_find_free_vertices(self):
         G = G1()
         matched_edges = {'a1': 'p2', 'p2': 'a1'}
@@ -182,5 +237,18 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual([('a2', 'p1'), ('a3', 'p2')], removed_edges)
 
 
+    def test_prune(self):
+        B = article_graph()  # example from article figure 3
+        cg = compact_graph.CompactRankedGraph.from_graph(B, rank="weight", top_nodes=["a1", "a2", "a3"])
+        label = np.full(cg.n, compact_graph.EVEN, dtype=np.int8)
+        label[[cg.index["p1"], cg.index["p2"]]] = compact_graph.ODD
+        alive = np.ones(cg.m, dtype=bool)
+        compact_graph.prune(cg, alive, label, 1)
+        removed_edges = {(cg.nodes[u], cg.nodes[v]) for u, v in zip(cg.tails[~alive].tolist(), cg.heads[~alive].tolist())}
+        self.assertEqual({('a2', 'p1'), ('a3', 'p2')}, removed_edges)
+        label[cg.index["a1"]] = compact_graph.UNREACHABLE  # makes (a1, p1) and (a1, p2) OU edges
+        compact_graph.prune(cg, alive, label, 1)
+        self.assertEqual(3, int(alive.sum()))
+
 if __name__ == '__main__':
     unittest.main()